@@ -1,28 +1,39 @@
-"""Module which publish all satellite6 upgrade tasks"""
-# pylint:disable=F401
-from upgrade.helpers.docker import docker_cleanup_containers
-from upgrade.helpers.docker import docker_execute_command
-from upgrade.helpers.docker import generate_satellite_docker_clients
-from upgrade.helpers.docker import refresh_subscriptions_on_docker_clients
-from upgrade.helpers.tasks import create_capsule_ak
-from upgrade.helpers.tasks import foreman_maintain_upgrade
-from upgrade.helpers.tasks import generate_custom_certs
-from upgrade.helpers.tasks import job_execution_time
-from upgrade.helpers.tasks import sync_capsule_repos_to_satellite
-from upgrade.helpers.tasks import update_scap_content
-from upgrade.helpers.tools import copy_ssh_key
-from upgrade.helpers.tools import disable_old_repos
-from upgrade.helpers.tools import get_hostname_from_ip
-from upgrade.helpers.tools import get_sat_cap_version
-from upgrade.helpers.tools import host_pings
-from upgrade.helpers.tools import host_ssh_availability_check
-from upgrade.helpers.tools import reboot
-from upgrade.runner import product_setup_for_db_upgrade
-from upgrade.runner import product_setup_for_upgrade_on_brokers_machine
-from upgrade.runner import product_upgrade
-from upgrade.satellite import satellite_setup
-from upgrade.satellite import satellite_upgrade
-from upgrade_tests.helpers.existence import set_datastore
-from upgrade_tests.helpers.existence import set_templatestore
-from upgrade_tests.helpers.scenarios import delete_manifest
-from upgrade_tests.helpers.scenarios import upload_manifest
+"""Module which publish all satellite6 upgrade tasks
+
+The task modules are imported only when their task is run, see
+upgrade.helpers.task_registry.
+"""
+from upgrade.helpers.task_registry import LazyTask
+
+docker_cleanup_containers = LazyTask('upgrade.helpers.docker', 'docker_cleanup_containers')
+docker_execute_command = LazyTask('upgrade.helpers.docker', 'docker_execute_command')
+generate_satellite_docker_clients = LazyTask(
+    'upgrade.helpers.docker', 'generate_satellite_docker_clients')
+refresh_subscriptions_on_docker_clients = LazyTask(
+    'upgrade.helpers.docker', 'refresh_subscriptions_on_docker_clients')
+create_capsule_ak = LazyTask('upgrade.helpers.tasks', 'create_capsule_ak')
+foreman_maintain_upgrade = LazyTask('upgrade.helpers.tasks', 'foreman_maintain_upgrade')
+generate_custom_certs = LazyTask('upgrade.helpers.tasks', 'generate_custom_certs')
+job_execution_time = LazyTask('upgrade.helpers.tasks', 'job_execution_time')
+sync_capsule_repos_to_satellite = LazyTask(
+    'upgrade.helpers.tasks', 'sync_capsule_repos_to_satellite')
+update_scap_content = LazyTask('upgrade.helpers.tasks', 'update_scap_content')
+copy_ssh_key = LazyTask('upgrade.helpers.tools', 'copy_ssh_key')
+disable_old_repos = LazyTask('upgrade.helpers.tools', 'disable_old_repos')
+get_hostname_from_ip = LazyTask('upgrade.helpers.tools', 'get_hostname_from_ip')
+get_sat_cap_version = LazyTask('upgrade.helpers.tools', 'get_sat_cap_version')
+host_pings = LazyTask('upgrade.helpers.tools', 'host_pings')
+host_ssh_availability_check = LazyTask('upgrade.helpers.tools', 'host_ssh_availability_check')
+reboot = LazyTask('upgrade.helpers.tools', 'reboot')
+product_setup_for_db_upgrade = LazyTask('upgrade.runner', 'product_setup_for_db_upgrade')
+product_setup_for_upgrade_on_brokers_machine = LazyTask(
+    'upgrade.runner', 'product_setup_for_upgrade_on_brokers_machine')
+product_upgrade = LazyTask('upgrade.runner', 'product_upgrade')
+satellite_setup = LazyTask('upgrade.satellite', 'satellite_setup')
+satellite_upgrade = LazyTask('upgrade.satellite', 'satellite_upgrade')
+convert_json_datastore = LazyTask('upgrade_tests.helpers.existence', 'convert_json_datastore')
+set_datastore = LazyTask('upgrade_tests.helpers.existence', 'set_datastore')
+set_templatestore = LazyTask('upgrade_tests.helpers.existence', 'set_templatestore')
+delete_manifest = LazyTask('upgrade_tests.helpers.scenarios', 'delete_manifest')
+upload_manifest = LazyTask('upgrade_tests.helpers.scenarios', 'upload_manifest')
+import_cost_report = LazyTask('upgrade.helpers.task_registry', 'import_cost_report')
@@ -1,9 +1,12 @@
+import multiprocessing
 import sys
+from contextlib import contextmanager
 
 from fabric.api import execute
 from fabric.api import run
 
 from upgrade.helpers import settings
+from upgrade.helpers.journal import run_step
 from upgrade.helpers.logger import logger
 from upgrade.helpers.tasks import add_baseOS_repos
 from upgrade.helpers.tasks import capsule_sync
@@ -19,12 +22,55 @@ from upgrade.helpers.tasks import upgrade_validation
 from upgrade.helpers.tasks import wait_untill_capsule_sync
 from upgrade.helpers.tasks import yum_repos_cleanup
 from upgrade.helpers.tools import copy_ssh_key
-from upgrade.helpers.tools import host_pings
 from upgrade.helpers.tools import host_ssh_availability_check
+from upgrade.helpers.tools import hosts_reachable
 from upgrade.helpers.tools import reboot
 
 logger = logger()
 
+# Bounds the capsule syncs running on satellite at a time while capsules upgrade concurrently
+_capsule_sync_slots = None
+
+
+def set_capsule_sync_limit(limit):
+    """Sets the number of capsule syncs allowed to run on satellite at a time
+
+    The semaphore is created before the capsule upgrade processes are forked,
+    so that all of them share it.
+
+    :param int limit: The number of concurrent capsule syncs, None to not limit
+    """
+    global _capsule_sync_slots
+    _capsule_sync_slots = multiprocessing.BoundedSemaphore(limit) if limit else None
+
+
+@contextmanager
+def capsule_sync_slot():
+    """Waits for a free capsule sync slot on satellite and holds it within the context"""
+    if _capsule_sync_slots is None:
+        yield
+        return
+    with _capsule_sync_slots:
+        yield
+
+
+def capsule_preflight_checks(capsule_hosts, timeout=15):
+    """Checks the ssh of all the capsules at once before the capsule setup
+
+    :param list capsule_hosts: List of capsule hostnames
+    :param int timeout: The polling timeout in minutes
+    :returns dict: Report of the capsules with keys `reachable`, mapping the
+        responsive capsules to their IP address, and `non_responsive` listing
+        the capsules not reachable over ssh within the timeout
+    """
+    ips = hosts_reachable(capsule_hosts, timeout=timeout, banner=True)
+    report = {
+        'reachable': {host: ip for host, ip in ips.items() if ip},
+        'non_responsive': [host for host, ip in ips.items() if not ip]
+    }
+    logger.info(f'Capsules preflight report: {report}')
+    return report
+
 
 def satellite_capsule_setup(satellite_host, capsule_hosts, os_version,
                             upgradable_capsule=True):
@@ -40,30 +86,29 @@ def satellite_capsule_setup(satellite_host, capsule_hosts, os_version,
     os_repos = settings.repos[f'{os_version}_os']
     if isinstance(os_repos, str):
         os_repos = {os_version: os_repos}
-    non_responsive_hosts = []
-    for cap_host in capsule_hosts:
-        if not host_pings(cap_host):
-            non_responsive_hosts.append(cap_host)
-        else:
-            execute(host_ssh_availability_check, cap_host)
-        if non_responsive_hosts:
-            logger.highlight(f'{non_responsive_hosts} these are non-responsive hosts. Aborting...')
-            sys.exit(1)
-        copy_ssh_key(satellite_host, capsule_hosts)
+    preflight = capsule_preflight_checks(capsule_hosts)
+    if preflight['non_responsive']:
+        logger.highlight(f'{preflight["non_responsive"]} these are non-responsive hosts. '
+                         f'Aborting...')
+        sys.exit(1)
+    copy_ssh_key(satellite_host, capsule_hosts)
     if upgradable_capsule:
         if settings.upgrade.distribution == "cdn":
             settings.repos.capsule_repo = None
             settings.repos.satclient_repo[settings.upgrade.os] = None
             settings.repos.satmaintenance_repo = None
-        new_ak_status = execute(create_capsule_ak, host=satellite_host)
+        new_ak_status = run_step(
+            'capsule ak', satellite_host, execute, create_capsule_ak, host=satellite_host)
         execute(update_capsules_to_satellite, capsule_hosts, host=satellite_host)
         if settings.upgrade.upgrade_with_http_proxy:
             execute(http_proxy_config, capsule_hosts, host=satellite_host)
         if False in new_ak_status.values():
-            execute(sync_capsule_repos_to_satellite, capsule_hosts, host=satellite_host)
+            run_step('capsule repos sync', satellite_host, execute,
+                     sync_capsule_repos_to_satellite, capsule_hosts, host=satellite_host)
             for cap_host in capsule_hosts:
                 settings.upgrade.capsule_hostname = cap_host
-                execute(add_baseOS_repos, **os_repos, host=cap_host)
+                run_step('capsule os repos', cap_host, execute, add_baseOS_repos, **os_repos,
+                         host=cap_host)
                 execute(yum_repos_cleanup, host=cap_host)
                 logger.info(f'Capsule {cap_host} is ready for Upgrade')
         return capsule_hosts
@@ -86,8 +131,9 @@ def satellite_capsule_upgrade(cap_host, sat_host, zstream=False):
             sys.exit(1)
     # Check the capsule sync before upgrade.
     logger.info("Checking the capsule sync after satellite upgrade to verify sync operation ")
-    execute(capsule_sync, cap_host, host=sat_host)
-    wait_untill_capsule_sync(cap_host)
+    with capsule_sync_slot():
+        execute(capsule_sync, cap_host, host=sat_host)
+        wait_untill_capsule_sync(cap_host)
 
     ak_name = settings.upgrade.capsule_ak[settings.upgrade.os]
     run(f'subscription-manager register '
@@ -104,12 +150,13 @@ def satellite_capsule_upgrade(cap_host, sat_host, zstream=False):
     foreman_maintain_upgrade(satellite=False)
 
     # Rebooting the capsule for kernel update if any
-    reboot(160)
+    reboot()
     host_ssh_availability_check(cap_host)
 
     # Check if Capsule upgrade is success
     upgrade_validation(upgrade_type="capsule", satellite_services_action="restart")
     # Check the capsule sync after upgrade.
     logger.info("Checking the capsule sync after capsule upgrade")
-    execute(capsule_sync, cap_host, host=sat_host)
-    wait_untill_capsule_sync(cap_host)
+    with capsule_sync_slot():
+        execute(capsule_sync, cap_host, host=sat_host)
+        wait_untill_capsule_sync(cap_host)
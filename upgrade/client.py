@@ -1,6 +1,5 @@
 import re
 import sys
-import time
 
 from automation_tools.repository import disable_repos
 from fabric.api import env
@@ -8,7 +7,9 @@ from fabric.api import execute
 from fabric.api import run
 
 from upgrade.helpers import settings
-from upgrade.helpers.docker import docker_execute_command
+from upgrade.helpers.docker import docker_execute_commands
+from upgrade.helpers.docker import docker_wait_for_clients
+from upgrade.helpers.docker import docker_yum_idle_command
 from upgrade.helpers.docker import generate_satellite_docker_clients
 from upgrade.helpers.docker import refresh_subscriptions_on_docker_clients
 from upgrade.helpers.logger import logger
@@ -65,7 +66,6 @@ def satellite6_client_setup():
         elif int(clients_count) < 2:
             logger.warning('Clients Count should be atleast 2, please rerun !')
             sys.exit(1)
-        time.sleep(5)
         logger.info('Generating {} clients on RHEL6 and RHEL7 on Docker. '
                     'Please wait .....'.format(clients_count))
         # Generate Clients on RHEL 7 and RHEL 6
@@ -93,12 +93,20 @@ def satellite6_client_setup():
             puppet=True,
             host=docker_vm
         )[docker_vm]
+        all_containers = list(clients6.values()) + list(clients7.values()) + \
+            list(puppet_clients6.values()) + list(puppet_clients7.values())
+        # Wait for the docker clients to be registered to satellite
+        execute(
+            docker_wait_for_clients,
+            all_containers,
+            'subscription-manager identity',
+            host=docker_vm
+        )
         # Sync latest sat tools repo to clients if downstream
         if all([
             settings.repos.sattools_repo.rhel6,
             settings.repos.sattools_repo.rhel7
         ]):
-            time.sleep(10)
             logger.info('Syncing Tools repos of rhel7 in Satellite..')
             all_clients7 = list(clients7.keys()) + list(puppet_clients7.keys())
             all_clients6 = list(clients6.keys()) + list(puppet_clients6.keys())
@@ -109,7 +117,6 @@ def satellite6_client_setup():
                 settings.upgrade.client_ak.rhel7,
                 host=sat_host
             )
-            time.sleep(10)
             logger.info('Syncing Tools repos of rhel6 in Satellite..')
             execute(
                 sync_client_repo_to_upgrade,
@@ -119,20 +126,20 @@ def satellite6_client_setup():
                 host=sat_host
             )
         # Refresh subscriptions on clients
-        time.sleep(30)
-        execute(
-            refresh_subscriptions_on_docker_clients,
-            list(clients6.values()) + list(puppet_clients6.values()),
-            host=docker_vm)
-        time.sleep(30)
-        execute(
-            refresh_subscriptions_on_docker_clients,
-            list(clients7.values()) + list(puppet_clients7.values()),
-            host=docker_vm)
+        execute(refresh_subscriptions_on_docker_clients, all_containers, host=docker_vm)
         # Resetting autosign conf
         execute(puppet_autosign_hosts, [''], False, host=sat_host)
-        time.sleep(400)
         logger.info("wait for all the running yum command's completions")
+        for agent, agent_clients in (
+                ('katello-agent', (clients6, clients7)),
+                ('puppet-agent', (puppet_clients6, puppet_clients7))):
+            execute(
+                docker_wait_for_clients,
+                [container for clients in agent_clients for container in clients.values()],
+                docker_yum_idle_command(agent),
+                timeout=7,
+                host=docker_vm
+            )
         for agent in puppet_clients7, puppet_clients6:
             execute(
                 docker_client_missing_package_installation,
@@ -178,8 +185,14 @@ def satellite6_client_upgrade(os_version, clients, puppet=False):
             host=docker_vm
         )
         # Fetching katello-agent version post upgrade from all clients
-        # Giving 5 minutes for docker clients to upgrade katello-agent
-        time.sleep(300)
+        # once the docker clients are done with upgrading katello-agent
+        execute(
+            docker_wait_for_clients,
+            list(clients.values()),
+            docker_yum_idle_command(agent),
+            timeout=5,
+            host=docker_vm
+        )
         client_vers = execute(
             docker_clients_agent_version,
             clients,
@@ -215,10 +228,14 @@ def docker_clients_upgrade(old_repo, clients, agent):
         container_id as value
     :param string agent: puppet-agent / katello-agent
     """
+    logger.info(f'Upgrading clients {list(clients)} on docker containers')
+    results = docker_execute_commands(
+        list(clients.values()),
+        [f'subscription-manager repos --disable {old_repo}', f'yum update -y {agent}'])
     for hostname, container in tuple(clients.items()):
-        logger.info(f'Upgrading client {hostname} on docker container: {container}')
-        docker_execute_command(container, f'subscription-manager repos --disable {old_repo}')
-        docker_execute_command(container, f'yum update -y {agent}', True)
+        if results[container]['return_code']:
+            logger.warning(f'Upgrade of {agent} failed on client {hostname} on docker container '
+                           f'{container}: {results[container]["stdout"]}')
 
 
 def docker_clients_agent_version(clients, agent):
@@ -232,11 +249,10 @@ def docker_clients_agent_version(clients, agent):
         its katello or puppet agent version as value
     """
     clients_dict = {}
+    results = docker_execute_commands(list(clients.values()), f'rpm -q {agent}')
     for hostname, container in tuple(clients.items()):
         try:
-            command_output = docker_execute_command(container, f'rpm -q {agent}')
-            pst = version_filter(command_output)
-            clients_dict[hostname] = pst
+            clients_dict[hostname] = version_filter(results[container]['stdout'])
         except Exception as ex:
             logger.warning(ex)
             clients_dict[hostname] = f"{agent} package not updated"
@@ -250,28 +266,24 @@ def docker_client_missing_package_installation(clients, agent):
         container_id as value
     :param string agent: puppet-agent / katello-agent
     """
-    for hostname, container in tuple(clients.items()):
-        logger.info(f'Installing client {hostname} on docker container: {container}')
-        try:
-            for _ in range(1, 15):
-                yum_status = docker_execute_command(container, 'pgrep yum', True)
-                if yum_status == '':
-                    break
-                logger.info("yum command is running wait fot 60 seconds...")
-                time.sleep(60)
-            command_output = docker_execute_command(container, f'rpm -q {agent}', True)
-            if re.search(f'package {agent} is not installed', command_output):
-                logger.warning(f'base version of {agent} package missed(because of timeout) on '
-                               f'{container} so installing it separately')
-                docker_execute_command(container, f'yum install -y {agent}', True)
-                command_output = docker_execute_command(container, f'rpm -q {agent}', True)
-                if re.search(f'package {agent} is not installed', command_output):
-                    logger.warning(f"failed to install package {agent} on {container}")
-                else:
-                    logger.info(f"base version of {agent} package {command_output} installed "
-                                f"successfully on {container}")
-            else:
-                logger.info(f"{agent} package {command_output} is available before "
-                            f"upgrade on {container}")
-        except Exception as ex:
-            logger.warning(ex)
+    containers = list(clients.values())
+    logger.info(f'Installing {agent} on docker containers: {containers}')
+    docker_wait_for_clients(containers, docker_yum_idle_command(), timeout=15)
+    results = docker_execute_commands(containers, f'rpm -q {agent}')
+    missing = [container for container in containers
+               if re.search(f'package {agent} is not installed', results[container]['stdout'])]
+    for container in set(containers) - set(missing):
+        logger.info(f"{agent} package {results[container]['stdout'].strip()} is available "
+                    f"before upgrade on {container}")
+    if not missing:
+        return
+    logger.warning(f'base version of {agent} package missed(because of timeout) on '
+                   f'{missing} so installing it separately')
+    results = docker_execute_commands(missing, [f'yum install -y {agent}', f'rpm -q {agent}'])
+    for container in missing:
+        command_output = results[container]['stdout'].strip().splitlines()[-1:]
+        if results[container]['return_code'] != 0:
+            logger.warning(f"failed to install package {agent} on {container}")
+        else:
+            logger.info(f"base version of {agent} package {command_output[0]} installed "
+                        f"successfully on {container}")
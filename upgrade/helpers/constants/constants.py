@@ -1,98 +1,124 @@
-"""Upgrade needed Constants"""
+"""Upgrade needed Constants
+
+The constants built from the settings are lazy, they are built on their first use.
+"""
+from functools import lru_cache
+
 from upgrade.helpers import settings
+from upgrade.helpers.lazy import lazy
 
-os_ver = int(settings.upgrade.os.strip('rhel'))
 arch = 'x86_64'
-target_version = settings.upgrade.to_version \
-    if settings.upgrade.from_version != settings.upgrade.to_version and \
-    settings.upgrade.distribution == 'cdn' else settings.upgrade.from_version
 os_repo_tags = ['baseos', 'appstream']
 
-RH_CONTENT = {
-    # RHEL8+ repos
-    'baseos': {
-        'prod': f'Red Hat Enterprise Linux for {arch}',
-        'reposet': f'Red Hat Enterprise Linux {os_ver} for {arch} - BaseOS (RPMs)',
-        'repo': f'Red Hat Enterprise Linux {os_ver} for {arch} - BaseOS RPMs {arch} {os_ver}',
-        'label': f'rhel-{os_ver}-for-{arch}-baseos-rpms',
-    },
-    'appstream': {
-        'prod': f'Red Hat Enterprise Linux for {arch}',
-        'reposet': f'Red Hat Enterprise Linux {os_ver} for {arch} - AppStream (RPMs)',
-        'repo': f'Red Hat Enterprise Linux {os_ver} for {arch} - AppStream RPMs {arch} {os_ver}',
-        'label': f'rhel-{os_ver}-for-{arch}-appstream-rpms',
-    },
-    # PRODUCT repos
-    'client': {
-        'prod': f'Red Hat Enterprise Linux for {arch}',
-        'reposet': f'Red Hat Satellite Client 6 for RHEL {os_ver} {arch} (RPMs)',
-        'repo': f'Red Hat Satellite Client 6 for RHEL {os_ver} {arch} RPMs',
-        'label': f'satellite-client-6-for-rhel-{os_ver}-{arch}-rpms'
-    },
-    'capsule': {
-        'prod': 'Red Hat Satellite Capsule',
-        'reposet': f'Red Hat Satellite Capsule {target_version} for RHEL {os_ver} {arch} '
-        '(RPMs)',
-        'repo': f'Red Hat Satellite Capsule {target_version} for RHEL {os_ver} {arch} RPMs',
-        'label': f'satellite-capsule-{target_version}-for-rhel-{os_ver}-{arch}-rpms'
-    },
-    'maintenance': {
-        'prod': f'Red Hat Enterprise Linux for {arch}',
-        'reposet': f'Red Hat Satellite Maintenance {target_version} for RHEL {os_ver} {arch} '
-        '(RPMs)',
-        'repo': f'Red Hat Satellite Maintenance {target_version} for RHEL {os_ver} {arch} RPMs',
-        'label': f'satellite-maintenance-{target_version}-for-rhel-{os_ver}-{arch}-rpms'
-    },
-}
 
-OS_REPOS = dict(filter(lambda i: i[0] in os_repo_tags, RH_CONTENT.items()))
-
-CUSTOM_CONTENT = {
-    'capsule': {
-        'prod': 'capsule_latest',
-        'reposet': 'capsule_latest_repo',
-    },
-    'capsule_client': {
-        'prod': 'capsuleclient_product',
-        'reposet': 'capsuleclient_repo',
-    },
-    'capsule_utils': {
-        'prod': 'capsuleutils_product',
-        'reposet': 'capsuleutils_repo',
-    },
-    'maintenance': {
-        'prod': f'maintenance_latest_{os_ver}',
-        'reposet': 'maintenance_repo',
-    },
-    'client': {
-        'prod': 'client_latest_{client_os}',
-        'reposet': 'client_repo',
-    },
-}
+@lru_cache(maxsize=None)
+def os_version():
+    """Returns the major version of the satellite OS e.g 7 for rhel7"""
+    return int(settings.upgrade.os.strip('rhel'))
 
 
-CUSTOM_SAT_REPO = {
-    "satellite": {
-        "repository": "satellite",
-        "repository_name": "Satellite",
-        "base_url": f"{settings.repos.satellite_repo}",
-    },
-    "maintenance": {
-        "repository": "maintenance",
-        "repository_name": "Satellite Maintenance",
-        "base_url": f"{settings.repos.satmaintenance_repo}",
-    },
-    "capsule": {
-        "repository": "capsule",
-        "repository_name": "Capsule",
-        "base_url": f"{settings.repos.capsule_repo}",
-    },
-    "satclient": {
-        "repository": "satclient",
-        "repository_name": "Satellite Client",
-        "base_url": f"{settings.repos.satclient_repo[settings.upgrade.os]}",
-    },
-}
+@lazy
+def RH_CONTENT():
+    os_ver = os_version()
+    target_version = settings.upgrade.to_version \
+        if settings.upgrade.from_version != settings.upgrade.to_version and \
+        settings.upgrade.distribution == 'cdn' else settings.upgrade.from_version
+    return {
+        # RHEL8+ repos
+        'baseos': {
+            'prod': f'Red Hat Enterprise Linux for {arch}',
+            'reposet': f'Red Hat Enterprise Linux {os_ver} for {arch} - BaseOS (RPMs)',
+            'repo': f'Red Hat Enterprise Linux {os_ver} for {arch} - BaseOS RPMs {arch} '
+            f'{os_ver}',
+            'label': f'rhel-{os_ver}-for-{arch}-baseos-rpms',
+        },
+        'appstream': {
+            'prod': f'Red Hat Enterprise Linux for {arch}',
+            'reposet': f'Red Hat Enterprise Linux {os_ver} for {arch} - AppStream (RPMs)',
+            'repo': f'Red Hat Enterprise Linux {os_ver} for {arch} - AppStream RPMs {arch} '
+            f'{os_ver}',
+            'label': f'rhel-{os_ver}-for-{arch}-appstream-rpms',
+        },
+        # PRODUCT repos
+        'client': {
+            'prod': f'Red Hat Enterprise Linux for {arch}',
+            'reposet': f'Red Hat Satellite Client 6 for RHEL {os_ver} {arch} (RPMs)',
+            'repo': f'Red Hat Satellite Client 6 for RHEL {os_ver} {arch} RPMs',
+            'label': f'satellite-client-6-for-rhel-{os_ver}-{arch}-rpms'
+        },
+        'capsule': {
+            'prod': 'Red Hat Satellite Capsule',
+            'reposet': f'Red Hat Satellite Capsule {target_version} for RHEL {os_ver} {arch} '
+            '(RPMs)',
+            'repo': f'Red Hat Satellite Capsule {target_version} for RHEL {os_ver} {arch} RPMs',
+            'label': f'satellite-capsule-{target_version}-for-rhel-{os_ver}-{arch}-rpms'
+        },
+        'maintenance': {
+            'prod': f'Red Hat Enterprise Linux for {arch}',
+            'reposet': f'Red Hat Satellite Maintenance {target_version} for RHEL {os_ver} '
+            f'{arch} (RPMs)',
+            'repo': f'Red Hat Satellite Maintenance {target_version} for RHEL {os_ver} '
+            f'{arch} RPMs',
+            'label': f'satellite-maintenance-{target_version}-for-rhel-{os_ver}-{arch}-rpms'
+        },
+    }
+
+
+@lazy
+def OS_REPOS():
+    return dict(filter(lambda i: i[0] in os_repo_tags, RH_CONTENT.items()))
+
+
+@lazy
+def CUSTOM_CONTENT():
+    return {
+        'capsule': {
+            'prod': 'capsule_latest',
+            'reposet': 'capsule_latest_repo',
+        },
+        'capsule_client': {
+            'prod': 'capsuleclient_product',
+            'reposet': 'capsuleclient_repo',
+        },
+        'capsule_utils': {
+            'prod': 'capsuleutils_product',
+            'reposet': 'capsuleutils_repo',
+        },
+        'maintenance': {
+            'prod': f'maintenance_latest_{os_version()}',
+            'reposet': 'maintenance_repo',
+        },
+        'client': {
+            'prod': 'client_latest_{client_os}',
+            'reposet': 'client_repo',
+        },
+    }
+
+
+@lazy
+def CUSTOM_SAT_REPO():
+    return {
+        "satellite": {
+            "repository": "satellite",
+            "repository_name": "Satellite",
+            "base_url": f"{settings.repos.satellite_repo}",
+        },
+        "maintenance": {
+            "repository": "maintenance",
+            "repository_name": "Satellite Maintenance",
+            "base_url": f"{settings.repos.satmaintenance_repo}",
+        },
+        "capsule": {
+            "repository": "capsule",
+            "repository_name": "Capsule",
+            "base_url": f"{settings.repos.capsule_repo}",
+        },
+        "satclient": {
+            "repository": "satclient",
+            "repository_name": "Satellite Client",
+            "base_url": f"{settings.repos.satclient_repo[settings.upgrade.os]}",
+        },
+    }
 
 
 CAPSULE_SUBSCRIPTIONS = {
@@ -7,6 +7,7 @@ from fauxfactory import gen_string
 
 from upgrade.helpers import settings
 from upgrade.helpers.logger import logger
+from upgrade.helpers.tools import run_parallel_commands
 
 logger = logger()
 
@@ -16,7 +17,8 @@ def generate_satellite_docker_clients(
         clients_count,
         custom_ak=None,
         org_label=None,
-        puppet=False):
+        puppet=False,
+        pool_size=20):
     """Generates satellite katello or puppet clients on docker as containers
 
     :param string client_os: Client OS of which client to be generated
@@ -26,6 +28,7 @@ def generate_satellite_docker_clients(
     :param string org_label: The organization in which the docker clients to
         created and where the custom ak is available
     :param bool puppet: Genearates puppet clients only if true
+    :param int pool_size: The number of containers created at a time
     :return dict: Returns the dictionary of katello or puppet clients
         By default katello clients will be created
 
@@ -51,6 +54,7 @@ def generate_satellite_docker_clients(
         host_title = 'scenariopuppetclient{0}'.format(
             gen_string('alpha')) if custom_ak else 'dockerpuppetclient'
         image = 'upgrade:puppet-{}'
+    create_commands = {}
     for count in range(int(clients_count)):
         # If custom activation key is passed, it will be used to create custom
         # docker clients for scenario tests and we will require to set distinct
@@ -65,8 +69,21 @@ def generate_satellite_docker_clients(
             create_command = 'docker run -d -h {0} -v /dev/log:/dev/log ' \
                 '-e "SATHOST={1}" -e "AK={2}" {3}'.format(
                     hostname, satellite_hostname, ak, image.format(client_os))
-        container_id = run(create_command)
-        result[hostname] = container_id
+        create_commands[hostname] = create_command
+    # All the containers are created by one remote batch, pool_size at a time
+    outputs = run_parallel_commands(create_commands, pool_size=pool_size)
+    failed = {}
+    for hostname in create_commands:
+        output = outputs.get(hostname, {'stdout': '', 'return_code': None})
+        if output['return_code'] == 0 and output['stdout'].strip():
+            # docker prints the image pull progress if any before the container id
+            result[hostname] = output['stdout'].strip().splitlines()[-1]
+        else:
+            failed[hostname] = output['stdout'].strip()
+    if failed:
+        logger.highlight(f'Failed to create docker clients {list(failed)}: {failed}')
+        sys.exit(1)
+    logger.info(f'{len(result)} {client_os} docker clients created')
     return result
 
 
@@ -91,14 +108,14 @@ def refresh_subscriptions_on_docker_clients(container_ids):
     :param list container_ids: The list of container ids onto which
     subscriptions will be refreshed
     """
-    if isinstance(container_ids, list):
-        for container_id in container_ids:
-            docker_execute_command(
-                container_id, 'subscription-manager refresh')
-            docker_execute_command(container_id, 'yum clean all', quiet=True)
-    else:
-        docker_execute_command(container_ids, 'subscription-manager refresh')
-        docker_execute_command(container_ids, 'yum clean all', quiet=True)
+    if not isinstance(container_ids, list):
+        container_ids = [container_ids]
+    results = docker_execute_commands(
+        container_ids, ['subscription-manager refresh', 'yum clean all'])
+    for container_id, result in results.items():
+        if result['return_code']:
+            logger.warning(f'Subscriptions refresh failed on {container_id}: {result["stdout"]}')
+    return results
 
 
 def docker_execute_command(container_id, command, quiet=True, **kwargs):
@@ -128,6 +145,77 @@ def docker_execute_command(container_id, command, quiet=True, **kwargs):
     )
 
 
+def docker_execute_commands(container_ids, commands, pool_size=20):
+    """Executes the commands on all the running docker containers at once
+
+    The commands of all the containers are run pool_size containers at a time
+    on the docker host through a single remote execution.
+
+    :param list container_ids: The ids of running containers to execute commands
+    :param commands: The command or the list of commands to run on each
+        container, the list of commands are run one after another
+    :param int pool_size: The number of containers executing commands at a time
+    :returns dict: The dict of container id and its result, the result is a
+        dict with 'stdout', 'return_code' (of the last command) and 'duration'
+    """
+    if isinstance(commands, str):
+        commands = [commands]
+    results = run_parallel_commands(
+        {container_id: '; '.join(f'docker exec {container_id} {command}' for command in commands)
+         for container_id in container_ids},
+        pool_size=pool_size
+    )
+    for container_id in container_ids:
+        results.setdefault(
+            container_id, {'stdout': 'command not executed', 'return_code': None, 'duration': 0})
+    return results
+
+
+def docker_yum_idle_command(package=None):
+    """Returns the command succeeding on a container once no yum/dnf process
+    runs on it and the package if given is installed
+
+    :param string package: The package to be installed on the container
+    """
+    command = '! pgrep -x \\"yum|dnf\\" >/dev/null'
+    if package:
+        command += f' && rpm -q {package}'
+    return f'sh -c "{command}"'
+
+
+def docker_wait_for_clients(container_ids, check_command, timeout=10, poll_interval=5,
+                            max_poll_interval=60):
+    """Waits until the check command succeeds on all the docker containers
+
+    All the pending containers are polled at once, with an exponential backoff
+    between polls, so it returns as soon as the last container is ready or
+    the timeout is reached.
+
+    :param list container_ids: The ids of running containers to be polled
+    :param string check_command: The command that succeeds on a ready container
+    :param int timeout: The polling timeout in minutes.
+    :param int poll_interval: First wait in seconds between the polls.
+    :param int max_poll_interval: Maximum wait in seconds between the polls.
+    :returns list: The containers not ready within the timeout
+    """
+    start = time.time()
+    timeup = start + int(timeout) * 60
+    pending = list(container_ids)
+    while pending:
+        results = docker_execute_commands(pending, check_command)
+        pending = [container for container in pending if results[container]['return_code'] != 0]
+        if not pending or time.time() + poll_interval > timeup:
+            break
+        logger.info(f'Waiting for {len(pending)} docker clients to be ready ...')
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, max_poll_interval)
+    if pending:
+        logger.warning(f'The docker clients {pending} are not ready after {timeout} mins')
+    else:
+        logger.info(f'Docker clients were ready in {round(time.time() - start, 2)} seconds')
+    return pending
+
+
 def docker_cleanup_containers():
     logger.info('Cleaning UP of Docker containers BEGINS')
     logger.info('Stopping all the running docker containers')
@@ -0,0 +1,71 @@
+"""A run scoped cache of the satellite entities searched by the upgrade tasks.
+
+The organization, location, product, repository set and subscription searches
+are repeated by many tasks, often inside loops, though their results do not
+change unless the tasks create, update or delete those entities. Such tasks
+invalidate the cached searches of the entity type they change.
+"""
+from nailgun.entity_mixins import Entity
+
+from upgrade.helpers import nailgun_conf
+from upgrade.helpers.logger import logger
+from upgrade.helpers.tracing import span
+
+logger = logger()
+
+_entity_cache = {}
+_entity_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _freeze(value):
+    """Returns the hashable form of the search query or entity fields value"""
+    if isinstance(value, Entity):
+        return type(value).__name__, getattr(value, 'id', None)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def search_entities(entity_cls, query=None, **fields):
+    """Searches the entities, returning the cached result of the same search if any
+
+    Usage:
+        search_entities(entities.Product, query={'per_page': 100}, name=name, organization=org)
+
+    :param entity_cls: The nailgun entity class to search e.g. `entities.Product`
+    :param dict query: The search query
+    :param fields: The entity fields the entity is initialised with
+    :returns list: The found entities, empty searches are not cached
+    """
+    key = (entity_cls.__name__, _freeze(fields), _freeze(query))
+    if key in _entity_cache:
+        _entity_cache_stats['hits'] += 1
+        return list(_entity_cache[key])
+    _entity_cache_stats['misses'] += 1
+    with span(f'{entity_cls.__name__} search', query=query):
+        results = entity_cls(nailgun_conf, **fields).search(query=query)
+    if results:
+        _entity_cache[key] = results
+    return list(results)
+
+
+def invalidate_entity_cache(*entity_classes):
+    """Drops the cached searches of the entity classes, of all entities if none given
+
+    :param entity_classes: The nailgun entity classes created, updated or deleted
+    """
+    names = {entity_cls.__name__ for entity_cls in entity_classes}
+    for key in [key for key in _entity_cache if not names or key[0] in names]:
+        del _entity_cache[key]
+
+
+def entity_cache_stats():
+    """Returns the hits, misses and size of the entity cache, and logs them
+
+    :returns dict: The dict with 'hits', 'misses' and 'size' keys
+    """
+    stats = dict(_entity_cache_stats, size=len(_entity_cache))
+    logger.info(f'Entity cache stats: {stats}')
+    return stats
@@ -0,0 +1,138 @@
+"""A set of helpers to run the satellite foreman tasks concurrently.
+
+The foreman tasks like repository sync, content view publish and capsule sync
+are submitted without waiting for them, and then all of them are polled
+together with one foreman tasks bulk search request per poll.
+"""
+import time
+from datetime import datetime
+
+from nailgun import client
+from nailgun import entities
+
+from upgrade.helpers import nailgun_conf
+from upgrade.helpers.logger import logger
+from upgrade.helpers.tracing import span
+
+logger = logger()
+
+# The foreman task states in which the task is no more running
+FINISHED_TASK_STATES = ('stopped', 'paused')
+
+
+def submit_foreman_task(entity_callable, **kwargs):
+    """Calls the entity method that triggers a foreman task, without waiting for it
+
+    Usage:
+        submit_foreman_task(entities.Repository(nailgun_conf, id=repo_id).sync)
+
+    :param entity_callable: The entity method object to call
+    :param kwargs: The kwargs to pass to the entity callable
+    :returns str: The id of the triggered foreman task
+    """
+    return entity_callable(synchronous=False, **kwargs)['id']
+
+
+def _bulk_search_tasks(task_ids):
+    """Fetches the given foreman tasks in a single request
+
+    :param list task_ids: The ids of the foreman tasks
+    :returns dict: The dict of task id and the task details
+    """
+    response = client.post(
+        entities.ForemanTask(nailgun_conf).path('bulk_search'),
+        json={'searches': [
+            {'type': 'task', 'task_id': task_id, 'search_id': task_id} for task_id in task_ids
+        ]},
+        **nailgun_conf.get_client_kwargs()
+    )
+    response.raise_for_status()
+    return {task['id']: task for search in response.json() for task in search['results']}
+
+
+def _task_duration(task, default):
+    """Returns the duration of the finished foreman task in seconds from its timestamps"""
+    try:
+        started, ended = (
+            datetime.fromisoformat(task[key].replace(' UTC', '+00:00'))
+            for key in ('started_at', 'ended_at'))
+        return round((ended - started).total_seconds(), 2)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return default
+
+
+@span('foreman tasks wait')
+def wait_for_foreman_tasks(tasks, timeout=9000, poll_rate=15):
+    """Waits for all the foreman tasks to finish, polling all of them together
+
+    The progress of the running tasks is logged on every poll and the
+    result and duration of each task as soon as it finishes.
+
+    :param dict tasks: The dict of task label and the foreman task id
+    :param int timeout: Maximum number of seconds to wait for the tasks
+    :param int poll_rate: Delay in seconds between the polls
+    :returns dict: The dict of task label and its status, the status is a dict
+        with 'id', 'result' (success, warning, error or timeout), 'duration'
+        in seconds and 'errors' keys
+    """
+    start = time.time()
+    pending = dict(tasks)
+    statuses = {}
+    while pending:
+        try:
+            found = _bulk_search_tasks(list(pending.values()))
+        except Exception as exp:
+            logger.warning(f'Foreman tasks search failed with exception: {exp}')
+            found = {}
+        for label, task_id in tuple(pending.items()):
+            task = found.get(task_id)
+            if not task:
+                continue
+            if task.get('state') not in FINISHED_TASK_STATES:
+                logger.info(f"Task {label} is {task.get('state')}, progress "
+                            f"{round(float(task.get('progress') or 0) * 100)}%")
+                continue
+            statuses[label] = {
+                'id': task_id,
+                'result': task.get('result'),
+                'duration': _task_duration(task, round(time.time() - start, 2)),
+                'errors': (task.get('humanized') or {}).get('errors', []),
+            }
+            del pending[label]
+            logger.highlight(f"Task {label} finished with result {statuses[label]['result']} "
+                             f"in {statuses[label]['duration']} seconds")
+            if statuses[label]['result'] != 'success':
+                logger.warning(f"Task {label} ({task_id}) errors: {statuses[label]['errors']}")
+        if pending and time.time() - start > timeout:
+            for label, task_id in pending.items():
+                statuses[label] = {
+                    'id': task_id, 'result': 'timeout', 'duration': timeout, 'errors': []}
+                logger.warning(f'Task {label} ({task_id}) did not finish in {timeout} seconds')
+            break
+        if pending:
+            time.sleep(poll_rate)
+    return statuses
+
+
+def run_foreman_tasks(entity_callables, timeout=9000, poll_rate=15):
+    """Triggers all the foreman tasks at once and waits for them together
+
+    A task which fails to be triggered is reported with the 'error' result.
+
+    :param dict entity_callables: The dict of task label and the entity method
+        object that triggers the task
+    :param int timeout: Maximum number of seconds to wait for the tasks
+    :param int poll_rate: Delay in seconds between the polls
+    :returns dict: The statuses of tasks as returned by wait_for_foreman_tasks
+    """
+    tasks = {}
+    statuses = {}
+    for label, entity_callable in entity_callables.items():
+        try:
+            tasks[label] = submit_foreman_task(entity_callable)
+            logger.info(f'Task {label} is triggered with id {tasks[label]}')
+        except Exception as exp:
+            logger.warning(f'Task {label} failed to trigger with exception: {exp}')
+            statuses[label] = {'id': None, 'result': 'error', 'duration': 0, 'errors': [str(exp)]}
+    statuses.update(wait_for_foreman_tasks(tasks, timeout=timeout, poll_rate=poll_rate))
+    return statuses
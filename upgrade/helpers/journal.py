@@ -0,0 +1,96 @@
+"""A journal of the completed setup and upgrade steps, to resume the failed runs.
+
+Every completed step is appended to the journal file with its result, keyed
+by (satellite, product, upgrade_type, host, step). A run started with resume
+skips the steps already completed by the previous runs of the same satellite,
+product and upgrade type and returns their recorded results, any other run
+starts the journal of its satellite, product and upgrade type over.
+"""
+import json
+import os
+import time
+
+from upgrade.helpers.logger import logger
+
+logger = logger()
+
+JOURNAL_FILE = 'upgrade_journal.jsonl'
+
+_journal = {'run': None, 'resume': False}
+
+
+def _append(entry):
+    # One write per entry keeps the lines of concurrent processes apart
+    with open(os.path.abspath(JOURNAL_FILE), 'a') as journal:
+        journal.write(json.dumps(entry) + '\n')
+
+
+def _completed_steps(run):
+    """Returns the completed steps of the run since it was last started over
+
+    :param list run: The [satellite, product, upgrade_type] of the run
+    :returns dict: The dict of (host, step) and the step result
+    """
+    steps = {}
+    if not os.path.exists(JOURNAL_FILE):
+        return steps
+    with open(JOURNAL_FILE) as journal:
+        for line in journal:
+            entry = json.loads(line)
+            if entry['run'] != run:
+                continue
+            if entry.get('start_over'):
+                steps.clear()
+            else:
+                steps[(entry['host'], entry['step'])] = entry['result']
+    return steps
+
+
+def start_journal(satellite, product, upgrade_type, resume=False):
+    """Starts journaling the steps of the run
+
+    :param str satellite: The satellite hostname of the run
+    :param str product: The product of the run e.g satellite, capsule, longrun
+    :param str upgrade_type: The upgrade type of the run, setup for setup runs
+    :param resume: Skip the steps completed by the previous runs, the fab
+        string arguments true/yes/1 are accepted
+    """
+    run = [satellite, product, upgrade_type]
+    resume = str(resume).lower() in ('true', 'yes', '1')
+    _journal.update(run=run, resume=resume)
+    if resume:
+        logger.highlight(f'Resuming the run {run}, completed steps: '
+                         f'{list(_completed_steps(run))}')
+    else:
+        _append({'run': run, 'start_over': True, 'time': time.time()})
+
+
+def run_step(step, target, func, *args, **kwargs):
+    """Runs the step unless it is completed already when the run resumes
+
+    The step is journaled as completed only if it returns, so failed steps
+    are run again.
+
+    :param str step: The step name
+    :param str target: The host the step runs for, None if not host specific
+    :param func: The step callable
+    :param args: The args of the step callable
+    :param kwargs: The kwargs of the step callable
+    :returns: The step result, the journaled result if the step is skipped
+    """
+    run = _journal['run']
+    if run is None:
+        return func(*args, **kwargs)
+    if _journal['resume']:
+        steps = _completed_steps(run)
+        if (target, step) in steps:
+            logger.highlight(f'Skipping the completed step {step} of {target or run[0]}')
+            return steps[(target, step)]
+    result = func(*args, **kwargs)
+    entry = {'run': run, 'host': target, 'step': step, 'result': result, 'time': time.time()}
+    try:
+        _append(entry)
+    except TypeError:
+        # The result is not json serializable, the step is journaled without it
+        _append(dict(entry, result=None))
+    return result
@@ -0,0 +1,90 @@
+"""Lazily built, memoized module level objects.
+
+The settings, the nailgun server config and the constants built from the
+settings are module level objects imported by almost every module. Building
+them at import loads all the conf files, which every fab command and the
+test collection pay even if they never read them. A lazy object is built by
+its factory function the first time it is used and then reused.
+
+Usage:
+    @lazy
+    def RH_CONTENT():
+        return {...}
+"""
+import copy
+from threading import RLock
+
+
+class LazyObject:
+    """The proxy of the object built by the factory on its first use
+
+    The attributes, items, iteration, length, membership, calls and copies
+    are forwarded to the built object.
+    """
+    def __init__(self, factory):
+        """
+        :param factory: The function with no arguments returning the object
+        """
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_wrapped', None)
+        object.__setattr__(self, '_lock', RLock())
+
+    def _setup(self):
+        """Returns the built object, building it if not built yet"""
+        if self._wrapped is None:
+            with self._lock:
+                if self._wrapped is None:
+                    object.__setattr__(self, '_wrapped', self._factory())
+        return self._wrapped
+
+    @property
+    def is_built(self):
+        """Whether the object is built already"""
+        return self._wrapped is not None
+
+    def __getattr__(self, name):
+        if name in ('_factory', '_wrapped', '_lock'):
+            # Not initialised, e.g. on copy
+            raise AttributeError(name)
+        return getattr(self._setup(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._setup(), name, value)
+
+    def __getitem__(self, key):
+        return self._setup()[key]
+
+    def __setitem__(self, key, value):
+        self._setup()[key] = value
+
+    def __iter__(self):
+        return iter(self._setup())
+
+    def __len__(self):
+        return len(self._setup())
+
+    def __contains__(self, key):
+        return key in self._setup()
+
+    def __call__(self, *args, **kwargs):
+        return self._setup()(*args, **kwargs)
+
+    def __copy__(self):
+        return copy.copy(self._setup())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self._setup(), memo)
+
+    def __repr__(self):
+        if not self.is_built:
+            return f'<LazyObject {self._factory.__name__} not built>'
+        return repr(self._wrapped)
+
+
+def lazy(factory):
+    """Decorator to replace the factory function by the lazy object it builds
+
+    :param factory: The function with no arguments returning the object
+    :returns LazyObject: The lazy object named after the factory
+    """
+    return LazyObject(factory)
@@ -1,9 +1,28 @@
+import atexit
+import fcntl
+import gzip
 import logging
+import multiprocessing.util
 import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from logging.handlers import RotatingFileHandler
 
 HIGHLIGHT_LEVEL_NUM = 25
 logging.addLevelName(HIGHLIGHT_LEVEL_NUM, 'HIGHLIGHT')
 
+# The log file size at which it is rotated, and the number of compressed rotations kept
+LOG_MAX_BYTES = 100 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+# The maximum number of records written before the log files are flushed
+LOG_BATCH_SIZE = 200
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
 
 class MyLogger(logging.Logger):
     """New Logger class to add new logger level"""
@@ -32,6 +51,224 @@ class SingleLevelClassFilter(logging.Filter):
             return (record.levelno == self.level)
 
 
+class BatchedFlushMixin:
+    """Handler mixin to flush the handler once per batch of records, not per record"""
+    def flush(self):
+        """Flushed by the log listener with flush_batch"""
+
+    def flush_batch(self):
+        try:
+            super().flush()
+        except (OSError, ValueError):
+            # The stream is closed already, e.g. by the test runner's capture at exit
+            pass
+
+
+class BatchedStreamHandler(BatchedFlushMixin, logging.StreamHandler):
+    """Console handler flushed once per batch of records"""
+
+
+def _open_writers_lock(filename):
+    """Opens the lock file beside the log file, held shared by the forked
+    processes appending to the log file until they exit
+    """
+    return os.open(f'{filename}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+
+
+class CompressedRotatingFileHandler(BatchedFlushMixin, RotatingFileHandler):
+    """File handler flushed once per batch of records, and rotated to gzip files by size"""
+    def __init__(self, filename, shared=False):
+        """
+        :param str filename: The log file path
+        :param bool shared: Whether the forked processes append to the log file too,
+            it is then not rotated while they are alive
+        """
+        super().__init__(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        self.shared = shared
+        self.namer = lambda name: f'{name}.gz'
+        self.rotator = self._compress
+
+    def doRollover(self):
+        if not self.shared:
+            return super().doRollover()
+        fd = _open_writers_lock(self.baseFilename)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+        try:
+            super().doRollover()
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as log_file, gzip.open(dest, 'wb') as gzip_file:
+            shutil.copyfileobj(log_file, gzip_file)
+        os.remove(source)
+
+
+class AppendFileHandler(logging.Handler):
+    """File handler writing each record with a single unbuffered append
+
+    Used by the forked processes for the log files shared with their parent and
+    the other forked processes, so that their records do not interleave. The
+    writers lock of the log file is held shared until the handler is closed,
+    so that the parent does not rotate the log file meanwhile.
+    """
+    def __init__(self, filename):
+        super().__init__()
+        self.baseFilename = filename
+        self.lock_fd = _open_writers_lock(filename)
+        fcntl.flock(self.lock_fd, fcntl.LOCK_SH)
+        self.fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def emit(self, record):
+        try:
+            os.write(self.fd, f'{self.format(record)}\n'.encode())
+        except Exception:
+            self.handleError(record)
+
+    def flush_batch(self):
+        """Nothing is buffered"""
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.lock_fd)
+        super().close()
+
+
+class HostFilesHandler(logging.Handler):
+    """Writes the records logged within host_log_file to that host's own log file"""
+    def __init__(self):
+        super().__init__()
+        self.host_handlers = {}
+
+    def emit(self, record):
+        for host in getattr(record, 'log_hosts', ()):
+            if host not in self.host_handlers:
+                hdlr = CompressedRotatingFileHandler(os.path.abspath(f'upgrade_{host}'))
+                hdlr.setFormatter(logging.Formatter(f'%(asctime)s %(levelname)s [{host}] '
+                                                    f'%(message)s'))
+                self.host_handlers[host] = hdlr
+            self.host_handlers[host].handle(record)
+
+    def flush_batch(self):
+        for hdlr in self.host_handlers.values():
+            hdlr.flush_batch()
+
+    def close(self):
+        for hdlr in self.host_handlers.values():
+            hdlr.close()
+        super().close()
+
+
+class BatchingQueueListener(QueueListener):
+    """Queue listener writing the records in batches
+
+    The handlers are flushed when the queue is drained or after LOG_BATCH_SIZE
+    records, and the writes are done under the lock which forking waits for.
+    """
+    def __init__(self, log_queue, *handlers, write_lock):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.write_lock = write_lock
+        self.pending = 0
+
+    def handle(self, record):
+        with self.write_lock:
+            super().handle(record)
+            self.pending += 1
+            if self.pending >= LOG_BATCH_SIZE or self.queue.empty():
+                self.flush_batch()
+
+    def flush_batch(self):
+        for hdlr in self.handlers:
+            hdlr.flush_batch()
+        self.pending = 0
+
+
+class LogPipeline:
+    """The non-blocking logging pipeline of the upgrade logger
+
+    The logger only enqueues the records and a listener thread writes them to
+    the console and the log files, so logging does not block on the disk and
+    terminal I/O. A forked process, like the fabric parallel tasks, gets its
+    own queue and listener thread, and flushes its logs when it exits.
+    """
+    def __init__(self):
+        self.write_lock = threading.Lock()
+        self.log_hosts = []
+        self.queue_handler = QueueHandler(queue.SimpleQueue())
+        self.queue_handler.addFilter(self._add_log_hosts)
+        full_hdlr = CompressedRotatingFileHandler(os.path.abspath('full_upgrade'), shared=True)
+        full_hdlr.setFormatter(logging.Formatter(LOG_FORMAT))
+        highlight_hdlr = CompressedRotatingFileHandler(
+            os.path.abspath('upgrade_highlights'), shared=True)
+        highlight_hdlr.addFilter(SingleLevelClassFilter(HIGHLIGHT_LEVEL_NUM, False))
+        self.handlers = (full_hdlr, highlight_hdlr, BatchedStreamHandler(), HostFilesHandler())
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        os.register_at_fork(before=self._before_fork, after_in_parent=self.write_lock.release,
+                            after_in_child=self._after_fork_in_child)
+        # Multiprocessing children exit without atexit, their logs are flushed by a finalizer
+        multiprocessing.util.register_after_fork(self, LogPipeline._register_finalizer)
+
+    def _add_log_hosts(self, record):
+        record.log_hosts = tuple(self.log_hosts)
+        return True
+
+    def start(self):
+        self.listener = BatchingQueueListener(
+            self.queue_handler.queue, *self.handlers, write_lock=self.write_lock)
+        self.listener.start()
+
+    def stop(self):
+        """Writes the queued records and stops the listener thread"""
+        if self.listener:
+            self.listener.stop()
+            with self.write_lock:
+                self.listener.flush_batch()
+            self.listener = None
+
+    def _before_fork(self):
+        # Nothing should be left in the handler buffers to be written again by the child
+        self.write_lock.acquire()
+        if self.listener:
+            self.listener.flush_batch()
+
+    def _after_fork_in_child(self):
+        # The parent's listener thread does not exist in the child, and the
+        # records queued in the parent are written by the parent
+        self.write_lock.release()
+        # The child appends each record to the log files shared with the parent at once
+        self.handlers = tuple(self._append_handler(hdlr) for hdlr in self.handlers)
+        self.queue_handler.queue = queue.SimpleQueue()
+        if self.listener:
+            self.start()
+
+    @staticmethod
+    def _append_handler(hdlr):
+        """Returns the append handler of the shared log file handler, else the handler"""
+        if not (isinstance(hdlr, AppendFileHandler)
+                or isinstance(hdlr, CompressedRotatingFileHandler) and hdlr.shared):
+            return hdlr
+        # Its buffer was flushed before the fork
+        hdlr.close()
+        append_hdlr = AppendFileHandler(hdlr.baseFilename)
+        append_hdlr.setFormatter(hdlr.formatter)
+        for log_filter in hdlr.filters:
+            append_hdlr.addFilter(log_filter)
+        return append_hdlr
+
+    def _register_finalizer(self):
+        multiprocessing.util.Finalize(self, self.stop, exitpriority=0)
+
+
+_pipeline = None
+
+
 def logger():
     """Logger to log messages to Console and to files
 
@@ -42,29 +279,36 @@ def logger():
     These highlight level logs have been used as contents of Upgrade status
     email sent via jenkins
 
+    The records are written by a background listener thread in batches, and
+    the log files are rotated to gzip files once they reach LOG_MAX_BYTES.
+
     :returns object log: Logger object to log different logging levels
     """
+    global _pipeline
     logging.setLoggerClass(MyLogger)
     log = logging.getLogger('upgrade_logging')
     paramiko_logger = logging.getLogger("paramiko.transport")
     paramiko_logger.disabled = True
     if not log.handlers:
-        # Log files
-        logfile_path = os.path.abspath('full_upgrade')
-        highlight_path = os.path.abspath('upgrade_highlights')
-        # Hamdlers
-        hdlr = logging.FileHandler(logfile_path)
-        hdlr2 = logging.FileHandler(highlight_path)
-        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-        hdlr.setFormatter(formatter)
-        ch = logging.StreamHandler()
-        # Filters
-        f1 = SingleLevelClassFilter(HIGHLIGHT_LEVEL_NUM, False)
-        hdlr2.addFilter(f1)
-        # Add Handlers
-        log.addHandler(hdlr)
-        log.addHandler(hdlr2)
-        log.addHandler(ch)
+        _pipeline = LogPipeline()
+        log.addHandler(_pipeline.queue_handler)
         # Set Level
         log.setLevel(logging.INFO)
     return log
+
+
+@contextmanager
+def host_log_file(host):
+    """Logs the messages of the context to the host's own log file as well
+
+    Used when several hosts are upgraded at a time, so that each host's logs
+    can be read apart from the interleaved full_upgrade logs.
+
+    :param str host: The hostname, the log file is named as upgrade_<host>
+    """
+    logger()
+    _pipeline.log_hosts.append(host)
+    try:
+        yield
+    finally:
+        _pipeline.log_hosts.remove(host)
@@ -0,0 +1,140 @@
+"""A registry of the fab tasks imported only when they are run.
+
+The fabfile registers each task by its module and function name, so that
+fab, even to run a small task like host_pings, imports only the module of
+the task it runs and not the modules of all the tasks. The task docstrings
+listed by `fab --list` are read from the module sources without importing
+them.
+
+Usage:
+    host_pings = LazyTask('upgrade.helpers.tools', 'host_pings')
+"""
+import ast
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from functools import lru_cache
+
+from fabric.tasks import get_task_details
+from fabric.tasks import Task
+
+from upgrade.helpers.logger import logger
+
+logger = logger()
+
+# The modules of the registered tasks, whose import cost is reported
+TASK_MODULES = []
+
+
+@lru_cache(maxsize=None)
+def _module_docstrings(module):
+    """Returns the docstrings of the module functions, read from the module source
+
+    :param str module: The dotted module name
+    :returns dict: The dict of function name and its docstring
+    """
+    with open(importlib.util.find_spec(module).origin) as source:
+        tree = ast.parse(source.read())
+    return {node.name: ast.get_docstring(node, clean=False)
+            for node in tree.body if isinstance(node, ast.FunctionDef)}
+
+
+# The fab task of the module function, the module is imported when the task runs
+class LazyTask(Task):
+    def __init__(self, module, func_name):
+        """
+        :param str module: The dotted module name of the task function
+        :param str func_name: The task function name, used as the fab task name
+        """
+        super().__init__(name=func_name)
+        self.module = module
+        if module not in TASK_MODULES:
+            TASK_MODULES.append(module)
+
+    @property
+    def __doc__(self):
+        return _module_docstrings(self.module).get(self.name)
+
+    @property
+    def wrapped(self):
+        """The task function, imported from its module"""
+        return getattr(importlib.import_module(self.module), self.name)
+
+    def __getattr__(self, name):
+        # The fabric decorator attributes like hosts and parallel of the task function
+        if name.startswith('_') or name in ('module', 'wrapped'):
+            raise AttributeError(name)
+        return getattr(self.wrapped, name)
+
+    def __details__(self):
+        return get_task_details(self.wrapped)
+
+    def run(self, *args, **kwargs):
+        return self.wrapped(*args, **kwargs)
+
+
+def _import_times(module):
+    """Imports the module in a new python process and returns its import times
+
+    :param str module: The dotted module name
+    :returns list: The list of (depth, name, self time, cumulative time) of each
+        import, times in milliseconds, in the order python reports them
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((depth, name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return times
+
+
+def import_cost_report(*modules, top=5, json_path='import_cost_report.json'):
+    """Reports the import time of the fabfile and of each task module, and their
+    heaviest imports
+
+    Each module is imported in a new python process, as fab does.
+
+    Usage:
+        fab import_cost_report
+        fab import_cost_report:upgrade.helpers.tasks,top=10
+
+    :param modules: The dotted module names, the fabfile and all the task modules
+        by default
+    :param int top: The number of the heaviest imports of each module to report
+    :param str json_path: The json report file path, not written if None
+    :returns dict: The dict of module name and the dict with its 'total' import
+        time and the 'heaviest' list of (name, cumulative time), times in milliseconds
+    """
+    report = {}
+    for module in modules or ['fabfile'] + TASK_MODULES:
+        times = _import_times(module)
+        # The imports of the module are reported right before the module itself
+        end = max((index for index, record in enumerate(times)
+                   if record[0] == 0 and record[1] == module), default=None)
+        if end is None:
+            logger.warning(f'Failed to import {module}')
+            continue
+        start = max((index + 1 for index, record in enumerate(times[:end])
+                     if record[0] == 0), default=0)
+        children = sorted((record for record in times[start:end] if record[0] == 1),
+                          key=lambda record: record[3], reverse=True)
+        report[module] = {
+            'total': times[end][3],
+            'heaviest': [(name, cumulative) for _, name, _, cumulative in children[:int(top)]],
+        }
+    for module, cost in sorted(report.items(), key=lambda item: item[1]['total'], reverse=True):
+        heaviest = ', '.join(f'{name} {cumulative:.1f}ms' for name, cumulative in cost['heaviest'])
+        logger.info(f'{module} imports in {cost["total"]:.1f}ms, heaviest: {heaviest}')
+    if json_path:
+        with open(json_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    return report
@@ -6,6 +6,8 @@ all environment variables are required.
 import socket
 import sys
 import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import nullcontext
 from datetime import datetime
 from io import StringIO
@@ -27,7 +29,9 @@ from fabric.api import run
 from fabric.api import settings as fabric_settings
 from fabric.context_managers import shell_env
 from fauxfactory import gen_string
+from nailgun import client
 from nailgun import entities
+from nailgun import entity_mixins
 from nailgun.entity_mixins import TaskFailedError
 
 from upgrade.helpers import nailgun_conf
@@ -39,11 +43,16 @@ from upgrade.helpers.constants.constants import DEFAULT_LOCATION
 from upgrade.helpers.constants.constants import DEFAULT_ORGANIZATION
 from upgrade.helpers.constants.constants import DEFAULT_ORGANIZATION_LABEL
 from upgrade.helpers.constants.constants import OS_REPOS
-from upgrade.helpers.constants.constants import os_ver
+from upgrade.helpers.constants.constants import os_version
 from upgrade.helpers.constants.constants import RH_CONTENT
+from upgrade.helpers.entity_cache import invalidate_entity_cache
+from upgrade.helpers.entity_cache import search_entities
+from upgrade.helpers.foreman_tasks import run_foreman_tasks
+from upgrade.helpers.foreman_tasks import wait_for_foreman_tasks
 from upgrade.helpers.logger import logger
 from upgrade.helpers.tools import call_entity_method_with_timeout
 from upgrade.helpers.tools import host_pings
+from upgrade.helpers.tracing import span
 
 logger = logger()
 
@@ -77,12 +86,10 @@ def update_capsules_to_satellite(capsules):
                                      "Aborting...")
                     sys.exit(1)
                 time.sleep(10)
-        loc = entities.Location(nailgun_conf).search(
-            query={'search': f'name="{DEFAULT_LOCATION}"'}
-        )[0]
-        org = entities.Organization(nailgun_conf).search(
-            query={'search': f'name="{DEFAULT_ORGANIZATION}"'}
-        )[0]
+        loc = search_entities(
+            entities.Location, query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
+        org = search_entities(
+            entities.Organization, query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
         try:
             smart_proxy.location.append(entities.Location(nailgun_conf, id=loc.id))
             smart_proxy.update(['location'])
@@ -105,10 +112,10 @@ def http_proxy_config(capsule_hosts):
     Set the http-proxy on the satellite server.
     :param capsule_hosts: list of capsule host
     """
-    loc = entities.Location(nailgun_conf).search(
-        query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
-    org = entities.Organization(nailgun_conf).search(
-        query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
+    loc = search_entities(
+        entities.Location, query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
+    org = search_entities(
+        entities.Organization, query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
     name = gen_string('alpha', 15)
     proxy_url = settings.http_proxy.un_auth_proxy_url
     entities.HTTPProxy(
@@ -180,6 +187,7 @@ def sync_capsule_repos_to_satellite(capsules):
         entities.Subscription(nailgun_conf, organization=org).upload(
             data={'organization_id': org.id}, files={'content': manifest}
         )
+        invalidate_entity_cache(entities.Subscription)
 
     ak = entities.ActivationKey(nailgun_conf, organization=org).search(
         query={'search': f'name={capsule_ak}'})[0]
@@ -194,10 +202,8 @@ def sync_capsule_repos_to_satellite(capsules):
     # rhscl and server repos combine
     logger.info("content view publish operation started successfully")
     try:
-        start_time = job_execution_time("CV_Publish")
-        call_entity_method_with_timeout(cv.read().publish, timeout=5000)
-        job_execution_time(f"content view {cv.name} publish operation(In past time-out value "
-                           f"was 2500 but in current execution we set it 5000)", start_time)
+        with span(f"content view {cv.name} publish", highlight=True, timeout=5000):
+            call_entity_method_with_timeout(cv.read().publish, timeout=5000)
     except Exception as exp:
         logger.critical(f"content view {cv.name} publish failed with exception {exp}")
         # Fix of 1770940, 1773601
@@ -222,10 +228,11 @@ def sync_capsule_repos_to_satellite(capsules):
         )
 
 
-def sync_capsule_subscription_to_capsule_ak(org):
+def sync_capsule_subscription_to_capsule_ak(org, sync=True):
     """
     Task to sync latest capsule repo which will later be used for capsule upgrade.
     :param org: `nailgun.entities.ActivationKey` used for capsule subscription
+    :param bool sync: Sync the repo, else only enable it to be synced later
     """
     from_version = settings.upgrade.from_version
     to_version = settings.upgrade.to_version
@@ -236,10 +243,12 @@ def sync_capsule_subscription_to_capsule_ak(org):
         try:
             cap_product = entities.Product(
                 nailgun_conf, name=CUSTOM_CONTENT['capsule']['prod'], organization=org).create()
+            invalidate_entity_cache(entities.Product, entities.Subscription)
         except Exception as ex:
             logger.warning(ex)
-            cap_product = entities.Product(nailgun_conf, organization=org).search(
-                query={"search": f'name={CUSTOM_CONTENT["capsule"]["prod"]}'}
+            cap_product = search_entities(
+                entities.Product, query={"search": f'name={CUSTOM_CONTENT["capsule"]["prod"]}'},
+                organization=org
             )[0]
         try:
             cap_repo = entities.Repository(
@@ -275,15 +284,11 @@ def sync_capsule_subscription_to_capsule_ak(org):
                 else:
                     logger.warning(result)
 
-        cap_product = entities.Product(
-            nailgun_conf,
-            name=capsule_prod,
-            organization=org
-        ).search(query={'per_page': 100})[0]
+        cap_product = search_entities(
+            entities.Product, query={'per_page': 100}, name=capsule_prod, organization=org)[0]
         logger.info(f"CDN capsule product {capsule_prod} is enabled.")
-        cap_reposet = entities.RepositorySet(
-            nailgun_conf, name=capsule_reposet, product=cap_product
-        ).search()[0]
+        cap_reposet = search_entities(
+            entities.RepositorySet, name=capsule_reposet, product=cap_product)[0]
         logger.info(f'entities of repository {capsule_reposet} search completed successfully')
         try:
             cap_reposet.enable(
@@ -292,30 +297,13 @@ def sync_capsule_subscription_to_capsule_ak(org):
                 })
         except requests.exceptions.HTTPError as exp:
             logger.warning(exp)
-        cap_repo = entities.Repository(
-            nailgun_conf, name=RH_CONTENT['capsule']['repo']).search(
-            query={'organization_id': org.id, 'per_page': 100}
-        )[0]
+        cap_repo = search_enabled_repository(org, RH_CONTENT['capsule']['repo'])
         logger.info(f"capsule repositoryset {RH_CONTENT['capsule']['repo']} "
                     f"search completed successfully")
 
-    logger.info(f"entities repository sync operation started successfully "
-                f"for name {cap_repo.name}")
-    start_time = job_execution_time("entity repository sync")
-    # Expected value 2500
-    try:
-        call_entity_method_with_timeout(
-            entities.Repository(nailgun_conf, id=cap_repo.id).sync, timeout=4000)
-        job_execution_time(
-            f"entity repository {cap_repo.name} sync (In past time-out value was "
-            f"2500 but in current execution we set it 4000)", start_time)
-    except Exception as exp:
-        logger.warning(f"Capsule repository sync failed with exception: {exp}")
-        repos_sync_failure_remiediation(org, cap_repo, timeout=4000)
-    job_execution_time(f"entity repository {cap_repo.name} sync (In past time-out value was "
-                       f"2500 but in current execution we set it 4000)", start_time)
-    logger.info(f"entities repository sync operation completed successfully "
-                f"for name {cap_repo.name}")
+    if sync:
+        # Expected value 2500
+        sync_repositories(org, [cap_repo], timeout=4000)
     if settings.upgrade.distribution != 'cdn':
         cap_repo.repo_id = CUSTOM_CONTENT['capsule']['reposet']
     else:
@@ -323,21 +311,23 @@ def sync_capsule_subscription_to_capsule_ak(org):
     return cap_repo
 
 
-def sync_os_repos_to_satellite(org):
+def sync_os_repos_to_satellite(org, sync=True):
     """
     Task to sync redhat repositories which will later be used for capsule upgrade.
     :param org: ``nailgun.entities.Organization` entity of capsule
+    :param bool sync: Sync the repos, else only enable them to be synced later
     :returns list: os repos nailgun objects
     """
     ent_repos = []
+    os_ver = os_version()
     for repo in OS_REPOS.values():
         arch = 'x86_64'
         relver = str(os_ver) if os_ver > 7 else f'{os_ver}Server'
-        ent_product = entities.Product(
-            nailgun_conf, name=repo['prod'], organization=org).search(query={'per_page': 100})[0]
+        ent_product = search_entities(
+            entities.Product, query={'per_page': 100}, name=repo['prod'], organization=org)[0]
         logger.info(f'product: {ent_product.name} is present')
-        ent_reposet = entities.RepositorySet(
-            nailgun_conf, name=repo['reposet'], product=ent_product).search()[0]
+        ent_reposet = search_entities(
+            entities.RepositorySet, name=repo['reposet'], product=ent_product)[0]
         logger.info(f'repository set: {ent_reposet.name} is present')
         try:
             ent_reposet.enable(
@@ -345,30 +335,66 @@ def sync_os_repos_to_satellite(org):
             logger.info(f'repository: {ent_reposet.name} for {arch} {relver} enabled successfully')
         except requests.exceptions.HTTPError as exp:
             logger.warning(exp)
-        time.sleep(20)
-        # Sync enabled Repo from cdn
-        ent_repo = entities.Repository(nailgun_conf, name=repo['repo']).search(
-            query={'organization_id': org.id, 'per_page': 100})[0]
-        logger.info(f'repository: {ent_repo.name} sync is about to start')
-        start_time = job_execution_time('Repository sync')
-        try:
-            call_entity_method_with_timeout(
-                entities.Repository(nailgun_conf, id=ent_repo.id).sync, timeout=6000)
-        except Exception as exp:
-            logger.warning(f'RH repository sync failed with exception: {exp}')
-            repos_sync_failure_remiediation(org, ent_repo, timeout=6000)
-        job_execution_time(f'repository: {ent_repo.name} sync has taken', start_time)
-        logger.info(f'repository: {ent_repo.name} sync operation completed successfully')
+        ent_repo = search_enabled_repository(org, repo['repo'])
         ent_repo.repo_id = repo['label']
         ent_repos.append(ent_repo)
+    # Sync enabled Repos from cdn
+    if sync:
+        sync_repositories(org, ent_repos, timeout=6000)
     return ent_repos
 
 
-def sync_client_repo_to_satellite_for_capsule(org):
+def search_enabled_repository(org, repo_name, timeout=120, poll_rate=2):
+    """Searches the repository, waiting for it to show up after its repository set is enabled
+
+    :param org: `nailgun.entities.Organization` entity of the repository
+    :param str repo_name: The name of the repository
+    :param int timeout: The polling timeout in seconds
+    :param int poll_rate: Delay in seconds between the searches
+    :returns: `nailgun.entities.Repository` entity of the repository
+    """
+    timeup = time.time() + timeout
+    while True:
+        repos = entities.Repository(nailgun_conf, name=repo_name).search(
+            query={'organization_id': org.id, 'per_page': 100})
+        if repos or time.time() > timeup:
+            return repos[0]
+        time.sleep(poll_rate)
+
+
+def sync_repositories(org, repos, timeout=6000):
+    """Syncs all the repositories at once and waits for them together
+
+    The repositories whose sync fails are synced again one by one after the
+    manifest refresh.
+
+    :param org: `nailgun.entities.Organization` entity of the repositories
+    :param list repos: `nailgun.entities.Repository` entities to sync
+    :param int timeout: The sync timeout in seconds
+    """
+    logger.info(f'repositories: {[repo.name for repo in repos]} sync is about to start')
+    with span('repositories sync', highlight=True, repos=[repo.name for repo in repos]):
+        # Keyed by id, the repositories of different products can have the same name
+        statuses = run_foreman_tasks(
+            {repo.id: entities.Repository(nailgun_conf, id=repo.id).sync for repo in repos},
+            timeout=timeout
+        )
+    for repo in repos:
+        status = statuses[repo.id]
+        if status['result'] != 'success':
+            logger.warning(f'repository: {repo.name} sync failed with '
+                           f'{status["result"]}: {status["errors"]}')
+            repos_sync_failure_remiediation(org, repo, timeout=timeout)
+        else:
+            logger.info(f'repository: {repo.name} sync operation completed successfully')
+
+
+def sync_client_repo_to_satellite_for_capsule(org, sync=True):
     """
     Creates custom / Enables RH Satellite Client repo on satellite and syncs for capsule upgrade
 
     :param org: `nailgun.entities.Organization` entity of capsule
+    :param bool sync: Sync the repo, else only enable it to be synced later
     :return: `nailgun.entities.repository` entity for capsule
     """
     arch = 'x86_64'
@@ -378,10 +404,11 @@ def sync_client_repo_to_satellite_for_capsule(org):
         try:
             ent_product = entities.Product(
                 nailgun_conf, name=repo['prod'], organization=org).create()
+            invalidate_entity_cache(entities.Product, entities.Subscription)
         except Exception as ex:
             logger.warning(ex)
-            ent_product = entities.Product(nailgun_conf, organization=org).search(
-                query={"search": f'name={repo["prod"]}'})[0]
+            ent_product = search_entities(
+                entities.Product, query={"search": f'name={repo["prod"]}'}, organization=org)[0]
         try:
             ent_repo = entities.Repository(
                 nailgun_conf, name=repo['reposet'], organization=org, product=ent_product,
@@ -408,11 +435,11 @@ def sync_client_repo_to_satellite_for_capsule(org):
                     logger.info("client repo already enabled so the error code 70 is expected")
                 else:
                     logger.warning(result)
-        ent_product = entities.Product(
-            nailgun_conf, name=repo['prod'], organization=org).search(query={'per_page': 100})[0]
+        ent_product = search_entities(
+            entities.Product, query={'per_page': 100}, name=repo['prod'], organization=org)[0]
         logger.info(f'product: {ent_product.name} is present')
-        ent_reposet = entities.RepositorySet(
-            nailgun_conf, name=repo['reposet'], product=ent_product).search()[0]
+        ent_reposet = search_entities(
+            entities.RepositorySet, name=repo['reposet'], product=ent_product)[0]
         logger.info(f'repository set: {ent_reposet.name} is present')
         try:
             ent_reposet.enable(data={'basearch': arch, 'organization_id': org.id})
@@ -425,26 +452,20 @@ def sync_client_repo_to_satellite_for_capsule(org):
         logger.info(f"repository: {repo['repo']} search completed successfully")
         ent_repo.repo_id = repo['label']
 
-    logger.info(f"repository: {ent_repo.name} sync is about to start")
-    start_time = job_execution_time("Entities repository sync")
-    try:
-        call_entity_method_with_timeout(
-            entities.Repository(nailgun_conf, id=ent_repo.id).sync, timeout=5000)
-    except Exception as exp:
-        logger.warning(f"repository: {ent_repo.name} sync failed with exception: {exp}")
-        repos_sync_failure_remiediation(org, ent_repo, timeout=5000)
-    job_execution_time(f'repository: {ent_repo.name} sync has taken', start_time)
-    logger.info(f'repository: {ent_repo.name} sync completed successfully')
+    if sync:
+        sync_repositories(org, [ent_repo], timeout=5000)
     return ent_repo
 
 
-def sync_maintenance_repo_to_satellite_for_capsule(org):
+def sync_maintenance_repo_to_satellite_for_capsule(org, sync=True):
     """
     Uses to enable the maintenance repo for capsule upgrade
     :param org: `nailgun.entities.Organization` entity of capsule
+    :param bool sync: Sync the repo, else only enable it to be synced later
     :return: `nailgun.entities.repository` entity for capsule
     """
     arch = 'x86_64'
+    os_ver = os_version()
     relver = str(os_ver) if os_ver > 7 else f'{os_ver}Server'
     if settings.upgrade.distribution != 'cdn':
         repo = CUSTOM_CONTENT['maintenance']
@@ -453,10 +474,11 @@ def sync_maintenance_repo_to_satellite_for_capsule(org):
                 nailgun_conf,
                 name=repo['prod'],
                 organization=org).create()
+            invalidate_entity_cache(entities.Product, entities.Subscription)
         except Exception as ex:
             logger.warning(ex)
-            ent_product = entities.Product(nailgun_conf, organization=org).search(
-                query={"search": f'name={repo["prod"]}'})[0]
+            ent_product = search_entities(
+                entities.Product, query={"search": f'name={repo["prod"]}'}, organization=org)[0]
         try:
             ent_repo = entities.Repository(
                 nailgun_conf,
@@ -487,40 +509,24 @@ def sync_maintenance_repo_to_satellite_for_capsule(org):
                 logger.info("maintenance repo already enabled so the error code 70 is expected")
             else:
                 logger.warning(result)
-        ent_product = entities.Product(nailgun_conf, name=repo['prod'], organization=org).search(
-            query={'per_page': 100})[0]
+        ent_product = search_entities(
+            entities.Product, query={'per_page': 100}, name=repo['prod'], organization=org)[0]
         logger.info(f'product: {ent_product.name} is present')
-        ent_reposet = entities.RepositorySet(
-            nailgun_conf, name=repo['reposet'], product=ent_product).search()[0]
+        ent_reposet = search_entities(
+            entities.RepositorySet, name=repo['reposet'], product=ent_product)[0]
         logger.info(f'repository set: {ent_reposet.name} is present')
         try:
             ent_reposet.enable(data={'basearch': arch, 'organization_id': org.id})
             logger.info(f'repository: {ent_reposet.name} for {arch} enabled successfully')
         except requests.exceptions.HTTPError as exp:
             logger.warning(exp)
-        time.sleep(5)
-        ent_repo = entities.Repository(
-            nailgun_conf, name=repo['repo']).search(
-            query={'organization_id': org.id, 'per_page': 100}
-        )[0]
+        ent_repo = search_enabled_repository(org, repo['repo'])
         logger.info(f"entities repository search completed successfully for maintenance "
                     f"repo {repo['repo']}")
         ent_repo.repo_id = repo['label']
 
-    logger.info(f"entities repository sync started successfully for "
-                f"maintenance repo {ent_repo.name}")
-    start_time = job_execution_time("Entities repository sync")
-    try:
-        call_entity_method_with_timeout(
-            entities.Repository(nailgun_conf, id=ent_repo.id).sync, timeout=5000)
-    except Exception as exp:
-        logger.warning(f"RH Maintenance repository sync failed with exception: {exp}")
-        repos_sync_failure_remiediation(org, ent_repo, timeout=5000)
-
-    job_execution_time(f"entities repository {ent_repo.name} sync(In past time-out "
-                       f"value was 2500 but in current execution we set it 5000)", start_time)
-    logger.info(f"entities repository sync completed successfully for "
-                f"maintenance repo {ent_repo.name}")
+    if sync:
+        sync_repositories(org, [ent_repo], timeout=5000)
     return ent_repo
 
 
@@ -531,10 +537,13 @@ def add_subscription_for_capsule(ak, org):
     :param ak: `nailgun.entities.ActivationKey` of capsule
     :param org: `nailgun.entities.org` of capsule
     """
-    os_repos = sync_os_repos_to_satellite(org)
-    cap_repo = sync_capsule_subscription_to_capsule_ak(org)
-    maintenance_repo = sync_maintenance_repo_to_satellite_for_capsule(org)
-    client_repo = sync_client_repo_to_satellite_for_capsule(org)
+    os_repos = sync_os_repos_to_satellite(org, sync=False)
+    cap_repo = sync_capsule_subscription_to_capsule_ak(org, sync=False)
+    maintenance_repo = sync_maintenance_repo_to_satellite_for_capsule(org, sync=False)
+    client_repo = sync_client_repo_to_satellite_for_capsule(org, sync=False)
+    # Waits as long as the slowest of the repos, the os repos, took on their own
+    sync_repositories(
+        org, os_repos + [cap_repo, maintenance_repo, client_repo], timeout=6000)
     sat_repos = [cap_repo, maintenance_repo, client_repo]
 
     # to update each repos fresh content view read is required,
@@ -562,8 +571,9 @@ def add_subscription_for_capsule(ak, org):
         logger.info(f"activation key content override successfully for "
                     f"content label:{cap_repo.name}")
     else:
-        cap_sub = entities.Subscription(nailgun_conf, organization=org).search(
-            query={'search': f'name={CUSTOM_CONTENT["capsule"]["prod"]}'})[0]
+        cap_sub = search_entities(
+            entities.Subscription,
+            query={'search': f'name={CUSTOM_CONTENT["capsule"]["prod"]}'}, organization=org)[0]
         try:
             ak.add_subscriptions(
                 data={'quantity': 1, 'subscription_id': cap_sub.id}
@@ -579,8 +589,9 @@ def add_subscription_for_capsule(ak, org):
         logger.info(f"cdn activation key successfully override for maintenance content_label"
                     f" {maintenance_repo.name}")
     else:
-        maintenance_sub = entities.Subscription(nailgun_conf, organization=org).search(
-            query={'search': f'name={CUSTOM_CONTENT["maintenance"]["prod"]}'})[0]
+        maintenance_sub = search_entities(
+            entities.Subscription,
+            query={'search': f'name={CUSTOM_CONTENT["maintenance"]["prod"]}'}, organization=org)[0]
         try:
             ak.add_subscriptions(
                 data={'quantity': 1, 'subscription_id': maintenance_sub.id}
@@ -598,8 +609,10 @@ def add_subscription_for_capsule(ak, org):
         logger.info(f"cdn activation key successfully override for "
                     f"capsule content_label {client_repo.name}")
     else:
-        client_sub = entities.Subscription(nailgun_conf, organization=org).search(
-            query={'search': f'name={CUSTOM_CONTENT["capsule_client"]["prod"]}'})[0]
+        client_sub = search_entities(
+            entities.Subscription,
+            query={'search': f'name={CUSTOM_CONTENT["capsule_client"]["prod"]}'},
+            organization=org)[0]
         try:
             ak.add_subscriptions(data={
                 'quantity': 1,
@@ -631,8 +644,8 @@ def sync_client_repo_to_upgrade(client_os, hosts, ak_name):
                          " Aborting...")
         sys.exit(1)
 
-    org = entities.Organization(nailgun_conf).search(
-        query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
+    org = search_entities(
+        entities.Organization, query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
     ak = entities.ActivationKey(nailgun_conf, organization=org).search(
         query={'search': 'name={}'.format(ak_name)})[0]
     cv = ak.content_view.read()
@@ -642,10 +655,11 @@ def sync_client_repo_to_upgrade(client_os, hosts, ak_name):
     try:
         ent_product = entities.Product(
             nailgun_conf, name=client_product_name, organization=org).create()
+        invalidate_entity_cache(entities.Product, entities.Subscription)
     except Exception as exp:
         logger.warning(exp)
-        ent_product = entities.Product(nailgun_conf, organization=org).search(
-            query={'search': f'name={client_product_name}'})[0]
+        ent_product = search_entities(
+            entities.Product, query={'search': f'name={client_product_name}'}, organization=org)[0]
     logger.info(f'product: {ent_product.name} is present')
     try:
         ent_repo = entities.Repository(
@@ -656,9 +670,9 @@ def sync_client_repo_to_upgrade(client_os, hosts, ak_name):
         ent_repo = entities.Repository(nailgun_conf, organization=org).search(
             query={'search': f'name={client_repo_name}'})[0]
     logger.info(f'repository: {ent_repo.name} is present')
-    start_time = job_execution_time(f'repository: {ent_repo.name} sync is about to start')
-    entities.Repository(nailgun_conf, id=ent_repo.id).sync()
-    job_execution_time(f'repository: {ent_repo.name} sync operation', start_time)
+    logger.info(f'repository: {ent_repo.name} sync is about to start')
+    with span(f'repository {ent_repo.name} sync', highlight=True):
+        entities.Repository(nailgun_conf, id=ent_repo.id).sync()
     logger.info(f'repository: {ent_repo.name} sync completed successfully')
     cv.repository += [ent_repo]
     try:
@@ -667,39 +681,33 @@ def sync_client_repo_to_upgrade(client_os, hosts, ak_name):
         logger.warning(exp)
     logger.info(f'content view: {cv.name} publish is about to start')
     try:
-        start_time = job_execution_time("CV_Publish")
-        call_entity_method_with_timeout(cv.read().publish, timeout=5000)
         # expected time out value is 3500
-        job_execution_time(f"content view: {cv.name} publish has taken", start_time)
+        with span(f"content view {cv.name} publish", highlight=True, timeout=5000):
+            call_entity_method_with_timeout(cv.read().publish, timeout=5000)
     except Exception as exp:
         logger.critical(f"content view: {cv.name} publish failed with exception {exp}")
     logger.info(f'content view: {cv.name} published successfully')
     published_ver = entities.ContentViewVersion(
         nailgun_conf, id=max([cv_ver.id for cv_ver in cv.read().version])).read()
     logger.info(f"details of the published_ver is {published_ver}")
-    start_time = job_execution_time("CV_Promotion")
     logger.info(f"content view: {cv.name} version promotion is about to start")
-    published_ver.promote(data={'environment_ids': [lenv.id], 'force': False})
-    job_execution_time(f"content view: {cv.name} promotion has taken", start_time)
+    with span(f"content view {cv.name} promotion", highlight=True):
+        published_ver.promote(data={'environment_ids': [lenv.id], 'force': False})
     logger.info(f"content view: {cv.name} version has been promoted successfully")
-    client_sub = entities.Subscription(nailgun_conf, organization=org).search(
-        query={'search': 'name={0}'.format(client_product_name)})[0]
+    client_sub = search_entities(
+        entities.Subscription,
+        query={'search': 'name={0}'.format(client_product_name)}, organization=org)[0]
     try:
         ak.add_subscriptions(data={'quantity': 1, 'subscription_id': client_sub.id})
     except Exception as exp:
         logger.warning(exp)
     logger.info(f'subscription: {client_sub.name} added successfully to ak: {ak.name}')
     # Add this latest tools repo to hosts to upgrade
-    sub = entities.Subscription(nailgun_conf, organization=org).search(
-        query={'search': 'name={0}'.format(client_product_name)})[0]
+    sub = search_entities(
+        entities.Subscription,
+        query={'search': 'name={0}'.format(client_product_name)}, organization=org)[0]
     logger.info(f'hosts: {hosts}')
-    for host in hosts:
-        host = entities.Host(nailgun_conf, organization=org).search(
-            query={'search': f'name={host}'}
-        )[0]
-        entities.HostSubscription(nailgun_conf, host=host).add_subscriptions(
-            data={'subscriptions': [{'id': sub.id, 'quantity': 1}]})
-        logger.info(f"subscription: {sub.name} assigned to host: {host.name}")
+    bulk_add_subscription_to_hosts(org, sub, hosts, org_hosts_only=True)
 
 
 def post_upgrade_test_tasks(sat_host, cap_host=None):
@@ -724,12 +732,14 @@ def post_upgrade_test_tasks(sat_host, cap_host=None):
     )[0]
     org.name = f"{DEFAULT_ORGANIZATION}"
     org.update(['name'])
+    invalidate_entity_cache(entities.Organization)
     # Update the Default Location name
     logger.info("update the Default Location name")
     loc = entities.Location(nailgun_conf).search(
         query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
     loc.name = f"{DEFAULT_LOCATION}"
     loc.update(['name'])
+    invalidate_entity_cache(entities.Location)
     # Increase log level to DEBUG, to get better logs in foreman_debug
     execute(lambda: run('sed -i -e \'/:level: / s/: .*/: '
                         'debug/\' /etc/foreman/settings.yaml'), host=sat_host)
@@ -770,12 +780,12 @@ def capsule_sync(cap_host):
                 format(cap_host))
     capsule = entities.Capsule(nailgun_conf).search(
         query={'search': 'name={}'.format(cap_host)})[0]
-    start_time = job_execution_time("Capsule content sync operation")
-    try:
-        capsule.content_sync()
-    except Exception as ex:
-        logger.critical(ex)
-    job_execution_time("Capsule content sync operation", start_time)
+    label = f'capsule {cap_host} content sync'
+    with span(label, host=cap_host, highlight=True):
+        status = run_foreman_tasks(
+            {label: capsule.content_sync}, timeout=entity_mixins.TASK_TIMEOUT)[label]
+    if status['result'] != 'success':
+        logger.critical(f"Capsule {cap_host} content sync {status['result']}: {status['errors']}")
 
 
 def capsule_certs_update(cap_host):
@@ -939,12 +949,9 @@ def foreman_maintain_upgrade(satellite=True):
     if not zstream and settings.upgrade.to_version == '6.15':
         run('satellite-installer --foreman-proxy-content-enable-katello-agent false')
 
-    preup_time = datetime.now().replace(microsecond=0)
-    upgrade_run(zstream)
-    postup_time = datetime.now().replace(microsecond=0)
-    delta_time = postup_time - preup_time
-
-    logger.highlight(f"{'Satellite' if satellite else 'Capsule'} upgrade has taken - {delta_time}")
+    with span(f"{'Satellite' if satellite else 'Capsule'} upgrade run", highlight=True,
+              zstream=zstream):
+        upgrade_run(zstream)
 
 
 def get_osp_hostname(ipaddr):
@@ -977,29 +984,37 @@ def puppet_autosign_hosts(hosts, append=True):
         run('echo "{0}" {1} /etc/puppetlabs/puppet/autosign.conf'.format(host, append))
 
 
-def wait_untill_capsule_sync(capsule):
-    """The polling function that waits for capsule sync task to finish
+def capsule_active_sync_tasks(capsule):
+    """Returns the active sync tasks of the capsule
 
     :param capsule: A capsule hostname
+    :returns dict: The dict of task label and the foreman task id
     """
     cap = entities.Capsule(nailgun_conf).search(
         query={'search': f'name={capsule}'})[0]
-    logger.info(f"Waiting for capsule {capsule} sync to finish ...")
     active_tasks = cap.content_get_sync()['active_sync_tasks']
     logger.info(f"Active tasks {active_tasks}")
+    return {f"capsule {capsule} sync {task['id']}": task['id'] for task in active_tasks}
+
+
+def wait_untill_capsule_sync(*capsules):
+    """The polling function that waits for capsules sync tasks to finish
+
+    The sync tasks of all the capsules are polled together.
+
+    :param capsules: The capsule hostnames
+    """
+    logger.info(f"Waiting for capsules {capsules} sync to finish ...")
+    active_tasks = {}
+    for capsule in capsules:
+        active_tasks.update(capsule_active_sync_tasks(capsule))
     if len(active_tasks) >= 1:
         logger.info(
             'Wait for background capsule sync to finish on '
-            'capsule: {}'.format(cap.name))
-        start_time = job_execution_time("capsule_sync")
-        for task in active_tasks:
-            try:
-                entities.ForemanTask(nailgun_conf, id=task['id']).poll(timeout=9000)
-            except Exception as ex:
-                logger.warning(f"Task id {task['id']} failed with {ex}")
-        job_execution_time("Background capsule sync operation(In past time-out value was "
-                           "2700 but in current execution we have set it 9000)",
-                           start_time)
+            'capsules: {}'.format(capsules))
+        with span('background capsule sync', highlight=True, capsules=list(capsules),
+                  timeout=9000):
+            wait_for_foreman_tasks(active_tasks, timeout=9000)
 
 
 def pre_upgrade_system_checks(capsules):
@@ -1009,8 +1024,7 @@ def pre_upgrade_system_checks(capsules):
     """
     # Check and wait if the capsule sync task is running before upgrade
     if capsules:
-        for capsule in capsules:
-            wait_untill_capsule_sync(capsule)
+        wait_untill_capsule_sync(*capsules)
 
 
 def generate_custom_certs():
@@ -1046,12 +1060,79 @@ def add_custom_product_subscription_to_hosts(org, product, hosts):
     :param str product: The custom product name
     :param list hosts: List of content host names
     """
-    for host in hosts:
-        sub = entities.Subscription(nailgun_conf, organization=org).search(
-            query={'search': f'name={product}'})[0]
-        host = entities.Host(nailgun_conf).search(query={'search': f'name={host}'})[0]
+    sub = search_entities(
+        entities.Subscription, query={'search': f'name={product}'}, organization=org)[0]
+    bulk_add_subscription_to_hosts(org, sub, hosts)
+
+
+def _add_subscription_to_host(host, sub):
+    """Adds the subscription to the host, returns the host name if it failed"""
+    try:
         entities.HostSubscription(nailgun_conf, host=host).add_subscriptions(
             data={'subscriptions': [{'id': sub.id, 'quantity': 1}]})
+    except Exception as exp:
+        logger.warning(f"subscription: {sub.name} failed to assign to host: {host.name}: {exp}")
+        return host.name
+    logger.info(f"subscription: {sub.name} assigned to host: {host.name}")
+
+
+def bulk_add_subscription_to_hosts(org, sub, hosts, org_hosts_only=False, batch_size=200,
+                                   workers=10):
+    """Adds the subscription to the hosts in batches with the katello bulk hosts API
+
+    The hosts of a batch are found by one search and subscribed by one bulk
+    request, if the bulk request fails then the hosts of the batch are
+    subscribed one by one, workers at a time.
+
+    :param object org: Organization object
+    :param object sub: Subscription object to be added
+    :param list hosts: List of content host names
+    :param bool org_hosts_only: Search the hosts in the organization only, else
+        in all the organizations
+    :param int batch_size: The number of hosts subscribed by one bulk request
+    :param int workers: The number of hosts subscribed at a time on the fallback
+    :returns list: The host names which failed to subscribe
+    :raises IndexError: If any of the hosts is not found
+    """
+    failed = []
+    hosts = list(hosts)
+    host_entity = (entities.Host(nailgun_conf, organization=org) if org_hosts_only
+                   else entities.Host(nailgun_conf))
+    for index in range(0, len(hosts), batch_size):
+        names = hosts[index:index + batch_size]
+        found = host_entity.search(query={
+            'search': f'name ^ ({",".join(names)})', 'per_page': len(names)})
+        # Satellite searches and stores the host names lowercase
+        found_names = {host.name.lower() for host in found}
+        missing = [name for name in names if name.lower() not in found_names]
+        if missing:
+            raise IndexError(f'hosts: {missing} are not found to add subscription {sub.name}')
+        try:
+            response = client.put(
+                f'{nailgun_conf.url}/api/hosts/bulk/add_subscriptions',
+                json={
+                    'organization_id': org.id,
+                    'included': {'ids': [host.id for host in found]},
+                    'subscriptions': [{'id': sub.id, 'quantity': 1}],
+                },
+                **nailgun_conf.get_client_kwargs()
+            )
+            response.raise_for_status()
+            label = f'subscription {sub.name} bulk add to {len(found)} hosts'
+            status = wait_for_foreman_tasks({label: response.json()['id']}, timeout=3000)[label]
+            if status['result'] != 'success':
+                raise TaskFailedError(status['errors'])
+            logger.info(f"subscription: {sub.name} assigned to hosts: "
+                        f"{[host.name for host in found]}")
+        except Exception as exp:
+            logger.warning(f'Bulk subscription of hosts failed with {exp}, subscribing them '
+                           f'one by one')
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                failed += [name for name in executor.map(
+                    _add_subscription_to_host, found, [sub] * len(found)) if name]
+    if failed:
+        logger.warning(f"subscription: {sub.name} is not assigned to hosts: {failed}")
+    return failed
 
 
 def repository_setup(repository, repository_name, base_url, enable=1, gpgcheck=0):
@@ -1139,10 +1220,10 @@ def update_scap_content():
         :param scap_content: Name of scap-content to be used while creating policy.
         :param str policy_name: Name of policy to be created.
         """
-        org = entities.Organization(nailgun_conf).search(
-            query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
-        loc = entities.Location(nailgun_conf).search(
-            query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
+        org = search_entities(
+            entities.Organization, query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
+        loc = search_entities(
+            entities.Location, query={'search': f'name="{DEFAULT_LOCATION}"'})[0]
         scap_content_profile_id = entities.ScapContents(
             nailgun_conf, id=scap_content.id).read().scap_content_profiles[0]['id']
         entities.CompliancePolicies(
@@ -1186,21 +1267,40 @@ def update_scap_content():
     scap(updated_scap_content, "updated_scap_content")
 
 
+# The spans started by job_execution_time, by task name and start time
+_job_spans = {}
+
+
 def job_execution_time(task_name, start_time=None):
     """
+    Deprecated, use the upgrade.helpers.tracing.span context manager instead, e.g.
+    with span(task_name, highlight=True):
+
     This function is used to collect the information of start and end time and
-    also calculate the total execution time
+    also calculate the total execution time, traced as the task_name span
     :param str task_name: Provide the action need to perform
     :param datetime start_time: If start_time is None then we capture the start time
     details.
     :return: start_time
     """
+    warnings.warn('job_execution_time is deprecated, use upgrade.helpers.tracing.span',
+                  DeprecationWarning, stacklevel=2)
     if start_time:
+        job_span = _job_spans.pop((task_name, start_time), None)
+        if job_span:
+            job_span.__exit__(None, None, None)
+            return
+        # Started by another process, e.g. by an earlier fab command
+        if isinstance(start_time, str):
+            start_time = datetime.fromisoformat(start_time)
         end_time = datetime.now().replace(microsecond=0)
         total_job_execution_time = str(end_time - start_time)
         logger.highlight(f'Time taken by task {task_name} - {total_job_execution_time}')
     else:
         start_time = datetime.now().replace(microsecond=0)
+        job_span = span(task_name, highlight=True)
+        job_span.__enter__()
+        _job_spans[(task_name, start_time)] = job_span
         return start_time
 
 
@@ -1233,6 +1333,7 @@ def repos_sync_failure_remiediation(org, repo_object, timeout=3000):
         )
     except Exception as exp:
         logger.warning(f'manifst refresh failed due to {exp}')
+    invalidate_entity_cache(entities.Subscription, entities.Product, entities.RepositorySet)
     # To handle HTTPError: 404 Client Error: Not Found for url:
     # https://xyz.com/katello/api/v2/repositories/2456/sync
     for attempt in range(1, 5):
@@ -1295,6 +1396,7 @@ def satellite_restore_setup():
     """
     answer_file = '/usr/share/satellite-clone/satellite-clone-vars.yml'
     mount_dir = '/tmp/customer-dbs'
+    os_ver = os_version()
     backup_dir = (f'{mount_dir}/{settings.clone.customer_name}'
                   f'{settings.upgrade.from_version.replace(".", "")}')
 
@@ -1335,12 +1437,10 @@ def satellite_restore():
         clone_cmd = f'cd {clone_dir}; ansible-playbook -i inventory satellite-clone-playbook.yml'
     else:
         clone_cmd = 'satellite-clone -y'
-    prerestore_time = datetime.now().replace(microsecond=0)
     with fabric_settings(warn_only=True):
-        restore_output = run(clone_cmd)
-        postrestore_time = datetime.now().replace(microsecond=0)
-        logger.highlight(f'Time taken by satellite restore - '
-                         f'{str(postrestore_time - prerestore_time)}')
+        with span('satellite restore', highlight=True) as restore_span:
+            restore_output = run(clone_cmd)
+            restore_span['tags']['return_code'] = restore_output.return_code
         run(f'umount {settings.clone.customer_dbs_mount}')
         if restore_output.return_code != 0:
             logger.highlight("Satellite restore completed with some error. Aborting...")
@@ -1353,13 +1453,11 @@ def satellite_backup():
     """
     satellite_backup_type = settings.upgrade.satellite_backup_type[randrange(2)]
     logger.info(f"running satellite backup in {satellite_backup_type} mode")
-    preyum_time = datetime.now().replace(microsecond=0)
     with fabric_settings(warn_only=True):
-        output = run(f"satellite-maintain backup {satellite_backup_type} "
-                     f"--plaintext --skip-pulp-content -y /tmp")
-        postyum_time = datetime.now().replace(microsecond=0)
-        logger.highlight(f'Time taken by {satellite_backup_type} satellite backup - '
-                         f'{str(postyum_time - preyum_time)}')
+        with span(f'{satellite_backup_type} satellite backup', highlight=True) as backup_span:
+            output = run(f"satellite-maintain backup {satellite_backup_type} "
+                         f"--plaintext --skip-pulp-content -y /tmp")
+            backup_span['tags']['return_code'] = output.return_code
         if output.return_code != 0:
             logger.warning(f"satellite backup failed in {satellite_backup_type} mode")
 
@@ -1423,18 +1521,20 @@ def create_capsule_ak():
             data={'organization_id': org.id},
             timeout=5000
         )
+        invalidate_entity_cache(entities.Subscription, entities.Product, entities.RepositorySet)
 
     def repos_sync(org):
         """
         Use to setup the repository sync
         """
-        logger.info("Syncing Ansible Engine repo..")
-        logger.info("Syncing server and scl repo..")
-        os_repos = sync_os_repos_to_satellite(org)
-        cap_repo = sync_capsule_subscription_to_capsule_ak(org)
-        maint_repo = sync_maintenance_repo_to_satellite_for_capsule(org)
-        sat_repos = [cap_repo, maint_repo]
-        return os_repos + sat_repos
+        # Enable all the repos first, then sync all of them together
+        os_repos = sync_os_repos_to_satellite(org, sync=False)
+        cap_repo = sync_capsule_subscription_to_capsule_ak(org, sync=False)
+        maint_repo = sync_maintenance_repo_to_satellite_for_capsule(org, sync=False)
+        all_repos = os_repos + [cap_repo, maint_repo]
+        logger.info("Syncing os, capsule and maintenance repos..")
+        sync_repositories(org, all_repos, timeout=6000)
+        return all_repos
 
     def lifecycle_setup(org):
         """
@@ -1478,13 +1578,8 @@ def create_capsule_ak():
         cv.update(['repository'])
         logger.info("content view publish operation started successfully")
         try:
-            start_time = job_execution_time("CV_Publish")
-            call_entity_method_with_timeout(cv.read().publish, timeout=5000)
-            job_execution_time(
-                f"content view {cv.name} publish operation(In past time-out value "
-                f"was 2500 but in current execution we set it 5000)",
-                start_time,
-            )
+            with span(f"content view {cv.name} publish", highlight=True, timeout=5000):
+                call_entity_method_with_timeout(cv.read().publish, timeout=5000)
         except Exception as exp:
             logger.critical(f"content view {cv.name} publish failed with exception {exp}")
             # Fix of 1770940, 1773601
@@ -1522,8 +1617,8 @@ def create_capsule_ak():
                 add_satellite_subscriptions_in_capsule_ak(ak, org, custom_repo=repo)
             ak_content_override(org, ak_name, repo)
 
-    org_object = entities.Organization(nailgun_conf).search(
-        query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
+    org_object = search_entities(
+        entities.Organization, query={'search': f'name="{DEFAULT_ORGANIZATION}"'})[0]
     activation_key_status = activation_key_availability_check(org_object)
     if not activation_key_status:
         manifest_upload(org_object)
@@ -1560,9 +1655,10 @@ def ak_add_subscription(org, ak, sub_name):
     :param ak: Activation Key to be changed
     :param sub_name: Name of the subscription to be added
     """
-    sub = entities.Subscription(nailgun_conf, organization=org).search(
-        query={'organization_id': f'{org.id}',
-               'search': f'name={sub_name}'})[0]
+    sub = search_entities(
+        entities.Subscription,
+        query={'organization_id': f'{org.id}', 'search': f'name={sub_name}'},
+        organization=org)[0]
     ak.add_subscriptions(data={
         'quantity': 1,
         'subscription_id': sub.id,
@@ -3,18 +3,27 @@
 Many commands are affected by environment variables. Unless stated otherwise,
 all environment variables are required.
 """
+import asyncio
+import base64
 import json
 import re
-import subprocess
 import time
+import uuid
+from io import StringIO
 from pathlib import Path
 
+from fabric.api import env
 from fabric.api import execute
+from fabric.api import hide
+from fabric.api import parallel
+from fabric.api import put
 from fabric.api import run
+from fabric.api import settings as fabric_settings
 from nailgun import entity_mixins
 
 from upgrade.helpers import settings
 from upgrade.helpers.logger import logger
+from upgrade.helpers.tracing import span
 
 logger = logger()
 
@@ -22,20 +31,95 @@ setup_data_file = 'product_setup.json'
 setup_file = Path(setup_data_file)
 
 
-def reboot(halt_time=300):
+# System states of `systemctl is-system-running` in which the rebooted host is ready to use
+READY_SYSTEM_STATES = ('running', 'degraded')
+
+
+def _boot_state():
+    """Returns the boot id and the system state of the fabric host
+
+    :returns tuple: (boot_id, system_state), (None, None) while the host is unreachable
+    """
+    try:
+        with fabric_settings(hide('everything'), warn_only=True, abort_exception=RuntimeError,
+                             connection_attempts=1, timeout=10):
+            output = run('cat /proc/sys/kernel/random/boot_id; systemctl is-system-running')
+    except Exception:
+        return None, None
+    lines = [line.strip() for line in output.splitlines()] + ['', '']
+    return lines[0] or None, lines[1]
+
+
+def reboot(timeout=900, poll_interval=2, max_poll_interval=30):
     """Reboots the host.
 
-    Also halts the execution until reboots according to given time.
+    Also halts the execution until the host is rebooted and ready, that is the
+    boot id of the host changed and the system state is running or degraded.
+    The host is polled with an exponential backoff between the given intervals.
 
-    :param int halt_time: Halt execution in seconds.
+    :param int timeout: Maximum time in seconds to wait for the host to be ready.
+    :param int poll_interval: First wait in seconds between the polls.
+    :param int max_poll_interval: Maximum wait in seconds between the polls.
+    :returns float: Time taken by the host to reboot in seconds.
     """
-    halt_time = halt_time
+    with span('reboot', timeout=timeout):
+        return _reboot(timeout, poll_interval, max_poll_interval)
+
+
+def _reboot(timeout, poll_interval, max_poll_interval):
+    old_boot_id, _ = _boot_state()
     logger.info('Rebooting the host, please wait .... ')
+    start = time.time()
     try:
         run('reboot', warn_only=True)
     except Exception as e:
         logger.info(e)
-    time.sleep(halt_time)
+    went_down = False
+    while time.time() - start < timeout:
+        time.sleep(poll_interval)
+        boot_id, state = _boot_state()
+        went_down = went_down or boot_id is None
+        # Without the old boot id, the host is rebooted once it is back after going down
+        rebooted = boot_id != old_boot_id if old_boot_id else went_down
+        if boot_id and rebooted:
+            if state in READY_SYSTEM_STATES:
+                duration = round(time.time() - start, 2)
+                logger.highlight(f'The host {env.host_string} rebooted in {duration} seconds')
+                return duration
+            logger.info(f'The host {env.host_string} is booting, system is {state}')
+        poll_interval = min(poll_interval * 2, max_poll_interval)
+    duration = round(time.time() - start, 2)
+    logger.warning(f'The host {env.host_string} is not ready {duration} seconds after reboot')
+    return duration
+
+
+def _ssh_pub_key():
+    """Generates(if not already) the ssh-key on the fabric host and returns its pubkey
+
+    Runs as one remote command, so it costs one ssh session.
+    """
+    return run(
+        'mkdir -p ~/.ssh; '
+        # do we have privkey? generate only pubkey
+        '[ ! -f ~/.ssh/id_rsa ] || [ -f ~/.ssh/id_rsa.pub ] || '
+        'ssh-keygen -y -f ~/.ssh/id_rsa > ~/.ssh/id_rsa.pub; '
+        # dont we have still pubkey? generate keypair
+        '[ -f ~/.ssh/id_rsa.pub ] || ssh-keygen -q -f ~/.ssh/id_rsa -t rsa -N \'\' >/dev/null; '
+        # read pubkey content in sanitized way
+        'cat ~/.ssh/id_rsa.pub')
+
+
+def _authorize_ssh_key(pub_key):
+    """Adds the pubkey to the fabric host's authorized keys unless already there
+
+    :param str pub_key: The ssh pubkey content to be authorized.
+    :returns bool: True if the key was added, False if already authorized.
+    """
+    return run(
+        f'mkdir -p ~/.ssh && touch ~/.ssh/authorized_keys && '
+        f'if grep -qxF "{pub_key}" ~/.ssh/authorized_keys; then echo present; '
+        f'else echo "{pub_key}" >> ~/.ssh/authorized_keys && echo added; fi'
+    ).strip() == 'added'
 
 
 def copy_ssh_key(from_host, to_hosts):
@@ -45,62 +129,96 @@ def copy_ssh_key(from_host, to_hosts):
     Beware that to and from hosts should have authorized key added
     for test-running host.
 
+    The key is pushed to all the to_hosts at once and only appended to the
+    authorized keys of hosts that don't have it yet, so reruns are cheap.
+
     :param string from_host: Hostname on which the key to be generated and
         to be copied from.
     :param list to_hosts: Hostnames on to which the ssh-key will be copied.
+    :returns dict: Whether the key was added on each of to_hosts.
 
     """
-    execute(lambda: run('mkdir -p ~/.ssh'), host=from_host)
-    # do we have privkey? generate only pubkey
-    execute(lambda: run(
-        '[ ! -f ~/.ssh/id_rsa ] || '
-        'ssh-keygen -y -f ~/.ssh/id_rsa > ~/.ssh/id_rsa.pub'), host=from_host)
-    # dont we have still pubkey? generate keypair
-    execute(lambda: run(
-        '[ -f ~/.ssh/id_rsa.pub ] || '
-        'ssh-keygen -f ~/.ssh/id_rsa -t rsa -N \'\''), host=from_host)
-    # read pubkey content in sanitized way
-    pub_key = execute(lambda: run(
-        '[ ! -f ~/.ssh/id_rsa.pub ] || cat ~/.ssh/id_rsa.pub'),
-        host=from_host)[from_host]
-    if pub_key:
-        for to_host in to_hosts:
-            execute(lambda: run('mkdir -p ~/.ssh'), host=to_host)
-            # deploy pubkey to another host
-            execute(lambda: run(
-                'echo "{0}" >> ~/.ssh/authorized_keys'.format(pub_key)
-            ), host=to_host)
+    pub_key = execute(_ssh_pub_key, host=from_host)[from_host].strip()
+    if not (pub_key and to_hosts):
+        return {}
+    added = execute(parallel(pool_size=10)(_authorize_ssh_key), pub_key, hosts=list(to_hosts))
+    logger.info(f'The ssh-key of {from_host} is added to '
+                f'{[host for host, status in added.items() if status is True]}')
+    return added
+
+
+async def _probe_host(host, deadline, port=22, banner=False, interval=5, connect_timeout=10):
+    """Polls the host's TCP port until it accepts the connection or the deadline passes
+
+    :param str host: The IP or hostname of host.
+    :param float deadline: The event loop time after which the host is reported unreachable.
+    :param int port: The TCP port to connect to.
+    :param bool banner: Whether the port should also answer with an SSH banner.
+    :param int interval: Wait in seconds between the connection attempts.
+    :param int connect_timeout: Timeout in seconds of a connection attempt.
+    :returns str: The IP address of the host if reachable else None
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), connect_timeout)
+            try:
+                ip = writer.get_extra_info('peername')[0]
+                if not banner or (await asyncio.wait_for(
+                        reader.readline(), connect_timeout)).startswith(b'SSH-'):
+                    return ip
+            finally:
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), connect_timeout)
+                except (OSError, asyncio.TimeoutError):
+                    pass
+        except (OSError, asyncio.TimeoutError):
+            pass
+        if loop.time() + interval > deadline:
+            return None
+        await asyncio.sleep(interval)
+
+
+async def _probe_hosts(hosts, timeout, **probe_kwargs):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + int(timeout) * 60
+    ips = await asyncio.gather(*(_probe_host(host, deadline, **probe_kwargs) for host in hosts))
+    return dict(zip(hosts, ips))
+
+
+def hosts_reachable(hosts, timeout=15, port=22, banner=False):
+    """Checks all the given hosts at once for their TCP port to be reachable
+
+    Each host is polled on its own until it is reachable or its deadline of
+    timeout minutes passes, so a sweep takes as long as the slowest host.
+
+    :param list hosts: The IPs or hostnames of hosts.
+    :param int timeout: The polling timeout in minutes.
+    :param int port: The TCP port to be checked.
+    :param bool banner: Whether the port should also answer with an SSH banner.
+    :returns dict: The IP address of each host, None for unreachable hosts
+    """
+    ips = asyncio.run(_probe_hosts(list(hosts), timeout, port=port, banner=banner))
+    for host, ip in ips.items():
+        if ip is None:
+            logger.warning(f'The timeout for reaching the host {host} on port {port} has reached!')
+    return ips
 
 
 def host_pings(host, timeout=15, ip_addr=False):
-    """This ensures the given IP/hostname pings succesfully.
+    """This ensures the given IP/hostname is reachable on its ssh port.
 
     :param host: A string. The IP or hostname of host.
     :param int timeout: The polling timeout in minutes.
     :param Boolean ip_addr: To return the ip address of the host
 
     """
-    timeup = time.time() + int(timeout) * 60
-    while True:
-        command = subprocess.Popen(
-            'ping -c1 {0}; echo $?'.format(host),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
-        )
-        output = command.communicate()[0].decode()
-        # Checking the return code of ping is 0
-        if time.time() > timeup:
-            logger.warning('The timeout for pinging the host {0} has '
-                           'reached!'.format(host))
-            return False
-        if int(output.split()[-1]) == 0:
-            if ip_addr:
-                ip = output[output.find("(") + 1:output.find(")")]
-                return True, ip
-            return True
-        else:
-            time.sleep(5)
+    ip = hosts_reachable([host], timeout=timeout)[host]
+    if ip and ip_addr:
+        return True, ip
+    return bool(ip)
 
 
 def host_ssh_availability_check(host, timeout=7):
@@ -110,25 +228,10 @@ def host_ssh_availability_check(host, timeout=7):
     :param int timeout: The polling timeout in minutes.
 
     """
-    _, ip = host_pings(host, timeout=timeout, ip_addr=True)
-    timeup = time.time() + int(timeout) * 60
-    while True:
-        command = subprocess.Popen(
-            'nc -vn {0} 22 <<< \'\''.format(ip),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
-        )
-        output = command.communicate()[1].decode()
-        print(output)
-        # Checking the return code of ping is 0
-        if time.time() > timeup:
-            logger.warning('SSH timed out for host {0} '.format(host))
-            return False
-        if output.__contains__('seconds'):
-            return True
-        else:
-            time.sleep(5)
+    if hosts_reachable([host], timeout=timeout, banner=True)[host]:
+        return True
+    logger.warning(f'SSH timed out for host {host} ')
+    return False
 
 
 def disable_old_repos(repo_name, timeout=1):
@@ -270,3 +373,100 @@ def call_entity_method_with_timeout(entity_callable, timeout=300, **kwargs):
         entity_callable(**kwargs)
     finally:
         entity_mixins.TASK_TIMEOUT = original_task_timeout
+
+
+def _parallel_commands_script(commands, pool_size):
+    """Generates the bash script run by run_parallel_commands
+
+    Every command is written to its own file in a temporary directory, the files
+    are executed through `xargs -P` and each result is printed as a single line
+    `<index> <return_code> <start> <end> <base64 encoded output>`.
+
+    :param list commands: The list of commands to run
+    :param int pool_size: The maximum number of commands running at a time
+    :return str: The bash script content
+    """
+    script = StringIO()
+    script.write('#! /bin/bash\n')
+    script.write('workdir=$(mktemp -d)\n')
+    script.write('trap \'rm -rf "$workdir"\' EXIT\n')
+    for index, command in enumerate(commands):
+        script.write(f"cat > \"$workdir/{index}.cmd\" <<'__PARALLEL_COMMAND__'\n")
+        script.write(f'{command}\n')
+        script.write('__PARALLEL_COMMAND__\n')
+    script.write(
+        'job() {\n'
+        '    start=$(date +%s.%N)\n'
+        '    bash "$1" > "${1%.cmd}.out" 2>&1\n'
+        '    echo "$? $start $(date +%s.%N)" > "${1%.cmd}.rc"\n'
+        '}\n'
+        'export -f job\n'
+        f'ls "$workdir"/*.cmd | xargs -P {int(pool_size)} -I CMD bash -c \'job "$1"\' _ CMD\n'
+        'for cmd in "$workdir"/*.cmd; do\n'
+        '    base=${cmd%.cmd}\n'
+        '    read rc start end < "$base.rc"\n'
+        '    echo "$(basename "$base") $rc $start $end $(base64 -w0 < "$base.out")"\n'
+        'done\n'
+    )
+    return script.getvalue()
+
+
+def _parse_parallel_commands_output(keys, output):
+    """Parses the output of the script generated by _parallel_commands_script
+
+    :param list keys: The keys of commands in the order they were given to the
+        script
+    :param str output: The output of the script
+    :return dict: The dict of command key and its result as returned by
+        run_parallel_commands
+    """
+    results = {}
+    for line in output.splitlines():
+        fields = line.strip().split(' ', 4)
+        if len(fields) < 4 or not fields[0].isdigit():
+            continue
+        index, return_code, start, end = fields[:4]
+        stdout = base64.b64decode(fields[4]).decode(errors='replace') if len(fields) > 4 else ''
+        try:
+            duration = round(float(end) - float(start), 3)
+        except ValueError:
+            duration = 0
+        results[keys[int(index)]] = {
+            'stdout': stdout,
+            # The rc file is missing or empty if the command was killed
+            'return_code': int(return_code) if return_code.lstrip('-').isdigit() else None,
+            'duration': duration,
+        }
+    return results
+
+
+def run_parallel_commands(commands, pool_size=10):
+    """Runs all the commands concurrently on the host in a single remote
+    execution and returns their outputs.
+
+    The commands are uploaded as one script which runs at most `pool_size` of
+    them at a time, so the host is reached over a single ssh connection
+    whatever the number of commands is.
+
+    :param dict commands: The dict of any hashable key and the command to run
+        e.g {'host': 'hammer --output csv host list'}
+    :param int pool_size: The maximum number of commands running at a time
+    :return dict: The dict of command key and its result, the result is a dict
+        with 'stdout' (stdout and stderr combined), 'return_code' (None if the
+        command was killed) and 'duration' (the command wall time in seconds) keys.
+        Commands that couldn't be run are missing from the result.
+    """
+    if not commands:
+        return {}
+    keys = list(commands.keys())
+    with span('parallel commands', commands=len(keys), pool_size=pool_size):
+        return _run_parallel_commands_script(keys, commands, pool_size)
+
+
+def _run_parallel_commands_script(keys, commands, pool_size):
+    script_path = f'/tmp/parallel_commands_{uuid.uuid4().hex}.sh'
+    script = StringIO(_parallel_commands_script([commands[key] for key in keys], pool_size))
+    put(local_path=script, remote_path=script_path)
+    script.close()
+    output = run(f'bash {script_path}; rm -f {script_path}', quiet=True)
+    return _parse_parallel_commands_output(keys, output)
@@ -0,0 +1,153 @@
+"""Nested timing spans of the upgrade runs.
+
+A span times a block of the run, the run itself, a product phase, a host, a
+task or a remote command / API call, and the spans started within it become
+its children. Finished spans are appended to the trace file as json lines, so
+the spans of the forked parallel processes are recorded too, and are exported
+to json and chrome trace format (chrome://tracing, ui.perfetto.dev) by
+export_trace. Each span carries the run id of its root span, so the spans of
+one run are exported apart from the earlier runs recorded in the trace file.
+
+Usage:
+    with span('capsule upgrade', host=cap_host):
+        ...
+
+    @span('satellite backup', highlight=True)
+    def satellite_backup():
+        ...
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from fabric.api import env
+
+from upgrade.helpers.logger import logger
+
+logger = logger()
+
+TRACE_FILE = 'upgrade_trace.jsonl'
+
+_current_span = ContextVar('current_span', default=None)
+
+
+def _write_span(record):
+    # One write per span keeps the lines of concurrent processes apart
+    with open(os.path.abspath(TRACE_FILE), 'a') as trace:
+        trace.write(json.dumps(record, default=str) + '\n')
+
+
+@contextmanager
+def span(name, host=None, highlight=False, **tags):
+    """Times the block as a span, child of the span the block runs in
+
+    It works as a decorator as well.
+
+    :param str name: The span name
+    :param str host: The host the span runs against, the fabric host by default
+    :param bool highlight: Log the time taken by the span to the upgrade highlights
+    :param tags: Any other json serializable details of the span
+    :yields dict: The span record, tags can be added to it's 'tags' within the block
+    """
+    parent = _current_span.get()
+    span_id = uuid.uuid4().hex[:16]
+    record = {
+        'id': span_id,
+        'run_id': parent['run_id'] if parent else span_id,
+        'parent_id': parent['id'] if parent else None,
+        'name': name,
+        'host': host or env.get('host_string') or (parent['host'] if parent else None),
+        'tags': tags,
+        'pid': os.getpid(),
+        'thread': threading.current_thread().name,
+        'start': time.time(),
+    }
+    token = _current_span.set(record)
+    try:
+        yield record
+        record['outcome'] = 'success'
+    except BaseException as exp:
+        record['outcome'] = 'error'
+        record['error'] = repr(exp)
+        raise
+    finally:
+        _current_span.reset(token)
+        record['end'] = time.time()
+        record['duration'] = round(record['end'] - record['start'], 3)
+        _write_span(record)
+        if highlight:
+            logger.highlight(f'Time taken by task {name} - '
+                             f'{timedelta(seconds=round(record["duration"]))}')
+
+
+def traced_run(name):
+    """Decorator to trace the fab task as the root span and export the trace after it
+
+    :param str name: The run span name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = [str(arg) for arg in args] + [f'{key}={val}' for key, val in kwargs.items()]
+            run_id = None
+            try:
+                with span(name, highlight=True, arguments=arguments) as record:
+                    run_id = record['run_id']
+                    return func(*args, **kwargs)
+            finally:
+                export_trace(run_id=run_id)
+        return wrapper
+    return decorator
+
+
+def read_trace(run_id=None):
+    """Returns the spans recorded in the trace file
+
+    :param str run_id: The run id of the spans to return, all the spans if None
+    """
+    if not os.path.exists(TRACE_FILE):
+        return []
+    with open(TRACE_FILE) as trace:
+        spans = [json.loads(line) for line in trace if line.strip()]
+    if run_id:
+        spans = [record for record in spans if record.get('run_id') == run_id]
+    return spans
+
+
+def export_trace(json_path='upgrade_trace.json', chrome_path='upgrade_trace_chrome.json',
+                 run_id=None):
+    """Exports the recorded spans as a json list and in chrome trace format
+
+    In the chrome trace, each process is a row group and each host a row.
+
+    :param str json_path: The json export file path, not written if None
+    :param str chrome_path: The chrome trace export file path, not written if None
+    :param str run_id: The run id of the spans to export, all the spans if None
+    :returns list: The exported spans
+    """
+    spans = sorted(read_trace(run_id), key=lambda record: record['start'])
+    if json_path:
+        with open(json_path, 'w') as export:
+            json.dump(spans, export, indent=2)
+    if chrome_path:
+        events = [{
+            'name': record['name'],
+            'cat': record['outcome'],
+            'ph': 'X',
+            'ts': int(record['start'] * 1e6),
+            'dur': int(record['duration'] * 1e6),
+            'pid': record['pid'],
+            'tid': record['host'] or record['thread'],
+            'args': dict(record['tags'], id=record['id'], run_id=record.get('run_id'),
+                         parent_id=record['parent_id'], error=record.get('error')),
+        } for record in spans]
+        with open(chrome_path, 'w') as export:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, export)
+    logger.info(f'{len(spans)} spans exported to {json_path} and {chrome_path}')
+    return spans
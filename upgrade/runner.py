@@ -1,17 +1,25 @@
 """A set of upgrade tasks for upgrading Satellite, Capsule and Client."""
 import sys
+import time
 
 from automation_tools import foreman_debug
 from automation_tools.satellite6.log import LogAnalyzer
 from distutils.version import LooseVersion
 from fabric.api import env
 from fabric.api import execute
+from fabric.api import parallel
+from fabric.api import settings as fabric_settings
 
 from upgrade.capsule import satellite_capsule_setup
+from upgrade.capsule import set_capsule_sync_limit
 from upgrade.capsule import satellite_capsule_upgrade
 from upgrade.client import satellite6_client_setup
 from upgrade.client import satellite6_client_upgrade
 from upgrade.helpers import settings
+from upgrade.helpers.entity_cache import entity_cache_stats
+from upgrade.helpers.journal import run_step
+from upgrade.helpers.journal import start_journal
+from upgrade.helpers.logger import host_log_file
 from upgrade.helpers.logger import logger
 from upgrade.helpers.tasks import check_settings_for_upgrade
 from upgrade.helpers.tasks import post_upgrade_test_tasks
@@ -24,6 +32,8 @@ from upgrade.helpers.tasks import unsubscribe
 from upgrade.helpers.tools import create_setup_dict
 from upgrade.helpers.tools import get_sat_cap_version
 from upgrade.helpers.tools import get_setup_data
+from upgrade.helpers.tracing import span
+from upgrade.helpers.tracing import traced_run
 from upgrade.satellite import satellite_setup
 from upgrade.satellite import satellite_upgrade
 
@@ -35,7 +45,9 @@ from upgrade.satellite import satellite_upgrade
 logger = logger()
 
 
-def product_setup_for_upgrade_on_brokers_machine(product, os_version, satellite, capsule=None):
+@traced_run('product setup')
+def product_setup_for_upgrade_on_brokers_machine(product, os_version, satellite, capsule=None,
+                                                 resume=False):
     """
     Sets up product(s) to perform upgrade on Satellite, Capsule and content host
     :param string product: The product name to setup before upgrade
@@ -43,28 +55,34 @@ def product_setup_for_upgrade_on_brokers_machine(product, os_version, satellite,
     :param satellite: brokers/users provided satellite
     :param capsule: brokers/users provided capsules, if the capsules count more than one then
      we keep them separate by a semicolon examplet: test1.xyz.com;test2.xyz.com
+    :param resume: Skip the setup steps completed by the previous setup run of the satellite
     """
     cap_hosts = None
     clients6 = clients7 = puppet_clients7 = puppet_clients6 = None
     env.disable_known_hosts = True
     check_settings_for_upgrade(product)
+    start_journal(satellite, product, 'setup', resume=resume)
 
     clients6 = clients7 = puppet_clients7 = puppet_clients6 = None
     logger.info('Setting up Satellite ....')
-    satellite_setup(satellite)
+    with span('satellite setup', host=satellite):
+        satellite_setup(satellite)
     if product in ['capsule', 'n-1', 'longrun']:
         cap_hosts = capsule.split()
         if len(cap_hosts) > 0:
             logger.info('Setting up Capsule ....')
-            satellite_capsule_setup(
-                satellite, cap_hosts, os_version, False if product == 'n-1' else True)
+            with span('capsules setup', capsules=cap_hosts):
+                satellite_capsule_setup(
+                    satellite, cap_hosts, os_version, False if product == 'n-1' else True)
         else:
             logger.highlight(f'No capsule is available for capsule setup from provided'
                              f' capsules: {cap_hosts}. Aborting...')
             sys.exit(1)
     if product in ['client', 'longrun']:
         logger.info('Setting up Clients ....')
-        clients6, clients7, puppet_clients7, puppet_clients6 = satellite6_client_setup()
+        with span('clients setup'):
+            clients6, clients7, puppet_clients7, puppet_clients6 = run_step(
+                'clients setup', None, satellite6_client_setup)
 
     setups_dict = {
         satellite: {
@@ -76,8 +94,10 @@ def product_setup_for_upgrade_on_brokers_machine(product, os_version, satellite,
             'puppet_clients6': puppet_clients6
         }}
     create_setup_dict(setups_dict)
+    entity_cache_stats()
 
 
+@traced_run('product db setup')
 def product_setup_for_db_upgrade(satellite):
     """
     Use to setup the customer db upgrade environment
@@ -92,7 +112,8 @@ def product_setup_for_db_upgrade(satellite):
     execute(satellite_restore, host=satellite)
 
 
-def product_upgrade(product, upgrade_type, satellite=None):
+@traced_run('product upgrade')
+def product_upgrade(product, upgrade_type, satellite=None, resume=False):
     """
     Used to drive the satellite, Capsule and Content-host upgrade based on their
     product type and upgrade type
@@ -108,11 +129,12 @@ def product_upgrade(product, upgrade_type, satellite=None):
 
     :param upgrade_type: Upgrade_type can be satellite, capsule and client
 
-
+    :param resume: Skip the satellite, capsules and clients upgraded by the previous run of
+        the same product and upgrade type, e.g. to retry only the failed capsules
     """
     def product_upgrade_satellite(sat_host):
         try:
-            with LogAnalyzer(sat_host):
+            with LogAnalyzer(sat_host), span('satellite upgrade', host=sat_host):
                 current = execute(get_sat_cap_version, 'sat', host=sat_host)[sat_host]
                 zstream = settings.upgrade.from_version == settings.upgrade.to_version
                 execute(satellite_upgrade, zstream, host=sat_host)
@@ -125,9 +147,9 @@ def product_upgrade(product, upgrade_type, satellite=None):
             execute(foreman_debug, f'satellite_{sat_host}', host=sat_host)
             raise
 
-    def product_upgrade_capsule(cap_host):
+    def product_upgrade_capsule(cap_host, satellite_tasks=True):
         try:
-            with LogAnalyzer(cap_host):
+            with LogAnalyzer(cap_host), span('capsule upgrade', host=cap_host):
                 current = execute(get_sat_cap_version, 'cap', host=cap_host)[cap_host]
                 zstream = settings.upgrade.from_version == settings.upgrade.to_version
                 execute(satellite_capsule_upgrade, cap_host, sat_host, zstream, host=cap_host)
@@ -137,14 +159,59 @@ def product_upgrade(product, upgrade_type, satellite=None):
                 execute(foreman_debug, f'capsule_{cap_host}', host=cap_host)
                 # Execute tasks as post upgrade tier1 tests
                 # are dependent
-            if product == 'capsule':
+            if product == 'capsule' and satellite_tasks:
                 execute(unsubscribe, host=sat_host)
-            if product == 'longrun':
+            if product == 'longrun' and satellite_tasks:
                 post_upgrade_test_tasks(sat_host, cap_host)
         except Exception:
             execute(foreman_debug, f'capsule_{cap_host}', host=cap_host)
             raise
 
+    def capsule_upgrade_state():
+        """Upgrades the capsule of the fabric host and returns its upgrade state
+
+        The failure is recorded in the state instead of raised, so that one
+        capsule's failure does not stop the other capsules upgrading with it.
+        """
+        cap_host = env.host
+        settings.upgrade.capsule_hostname = cap_host
+        start = time.time()
+        with host_log_file(cap_host):
+            try:
+                run_step('capsule upgrade', cap_host, product_upgrade_capsule, cap_host,
+                         satellite_tasks=False)
+                state = {'status': 'upgraded', 'error': None}
+            except (Exception, SystemExit) as err:
+                logger.error(f'Capsule {cap_host} upgrade failed: {err!r}')
+                state = {'status': 'failed', 'error': repr(err)}
+        state['duration'] = round(time.time() - start, 2)
+        return state
+
+    def product_upgrade_capsules_concurrently(concurrency):
+        set_capsule_sync_limit(settings.upgrade.capsule_sync_concurrency)
+        logger.highlight(f'Upgrading {len(cap_hosts)} capsules, {concurrency} at a time')
+        with fabric_settings(warn_only=True):
+            states = execute(parallel(pool_size=concurrency)(capsule_upgrade_state),
+                             hosts=cap_hosts)
+        failed_hosts = []
+        for cap_host in cap_hosts:
+            state = states.get(cap_host)
+            if not isinstance(state, dict):
+                state = {'status': 'failed', 'error': repr(state), 'duration': None}
+            logger.highlight(f'Capsule {cap_host} {state["status"]} in {state["duration"]} '
+                             f'seconds' + (f': {state["error"]}' if state['error'] else ''))
+            if state['status'] != 'upgraded':
+                failed_hosts.append(cap_host)
+        # The satellite wide tasks run once, after all the capsules upgrade
+        if product == 'capsule':
+            execute(unsubscribe, host=sat_host)
+        if product == 'longrun' and not failed_hosts:
+            post_upgrade_test_tasks(sat_host, cap_hosts)
+        if failed_hosts:
+            logger.highlight(f'Capsules {failed_hosts} failed to upgrade. Aborting...')
+            sys.exit(1)
+
+    @span('clients upgrade')
     def product_upgrade_client():
         clients6 = setup_dict['clients6']
         clients7 = setup_dict['clients7']
@@ -169,16 +236,23 @@ def product_upgrade(product, upgrade_type, satellite=None):
     cap_hosts = setup_dict['capsule_hosts']
     pre_upgrade_system_checks(cap_hosts)
     env['satellite_host'] = sat_host
+    start_journal(sat_host, product, upgrade_type, resume=resume)
 
     if upgrade_type == 'satellite':
-        product_upgrade_satellite(sat_host)
+        run_step('satellite upgrade', sat_host, product_upgrade_satellite, sat_host)
     elif (product == 'capsule' or product == 'longrun')\
             and upgrade_type == 'capsule':
-        for cap_host in cap_hosts:
-            settings.upgrade.capsule_hostname = cap_host
-            product_upgrade_capsule(cap_host)
+        concurrency = int(settings.upgrade.capsule_upgrade_concurrency or 1)
+        with span('capsules upgrade', capsules=cap_hosts, concurrency=concurrency):
+            if concurrency > 1 and len(cap_hosts) > 1:
+                product_upgrade_capsules_concurrently(concurrency)
+            else:
+                for cap_host in cap_hosts:
+                    settings.upgrade.capsule_hostname = cap_host
+                    run_step('capsule upgrade', cap_host, product_upgrade_capsule, cap_host)
     elif (product == 'client' or product == 'longrun') and upgrade_type == 'client':
-        product_upgrade_client()
+        run_step('clients upgrade', sat_host, product_upgrade_client)
+    entity_cache_stats()
 
 
 def check_upgrade_compatibility(upgrade_type, base_version, target_version):
@@ -6,6 +6,7 @@ from fabric.api import hide
 
 from upgrade.helpers import settings
 from upgrade.helpers.constants.constants import OS_REPOS
+from upgrade.helpers.journal import run_step
 from upgrade.helpers.logger import logger
 from upgrade.helpers.tasks import enable_disable_repo
 from upgrade.helpers.tasks import foreman_maintain_self_upgrade
@@ -31,7 +32,7 @@ def satellite_setup(satellite_host):
     """
     execute(host_ssh_availability_check, satellite_host)
     execute(yum_repos_cleanup, host=satellite_host)
-    execute(subscribe, host=satellite_host)
+    run_step('subscribe', satellite_host, execute, subscribe, host=satellite_host)
     env['satellite_host'] = satellite_host
     settings.upgrade.satellite_hostname = satellite_host
     execute(hammer_config, host=satellite_host)
@@ -66,7 +67,7 @@ def satellite_upgrade(zstream=False):
 
     # Rebooting the satellite for kernel update if any
     if settings.upgrade.satellite_capsule_setup_reboot:
-        reboot(180)
+        reboot()
     host_ssh_availability_check(env.get('satellite_host'))
 
     # Test the Upgrade is successful
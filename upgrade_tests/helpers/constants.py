@@ -1,10 +1,16 @@
 """API and CLI upgrade Tests Constants"""
-from nailgun import entities
+from functools import lru_cache
 
 from upgrade.helpers import nailgun_conf
 from upgrade.helpers import settings
 
-to_version = settings.upgrade.to_version
+
+def __getattr__(name):
+    # The settings based constants are read on their first use
+    if name == 'to_version':
+        return settings.upgrade.to_version
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 CLI_COMPONENTS = {
     'org_not_required':
@@ -97,11 +103,19 @@ CLI_ATTRIBUTES_KEY.update(dict.fromkeys(
 
 CLI_ATTRIBUTES_KEY["content-view"] = 'content view id'
 
-# This lambda function is used to create the constant file for API component
-# The id for an entity to get its data
 
-API_COMPONENTS = (lambda id=None: {
-    'domain': [entities.Domain(nailgun_conf), entities.Domain(nailgun_conf, id=id)],
-    'subnet': [entities.Subnet(nailgun_conf), entities.Subnet(nailgun_conf, id=id)],
-    'contentview': [entities.ContentView(nailgun_conf), entities.ContentView(nailgun_conf, id=id)]
-})
+@lru_cache(maxsize=None)
+def API_COMPONENTS(id=None):
+    """Returns the nailgun entities of the API components, built once per entity id
+
+    :param id: The id for an entity to get its data
+    """
+    # Imported here, importing the nailgun entities is a good part of the startup time
+    from nailgun import entities
+
+    return {
+        'domain': [entities.Domain(nailgun_conf), entities.Domain(nailgun_conf, id=id)],
+        'subnet': [entities.Subnet(nailgun_conf), entities.Subnet(nailgun_conf, id=id)],
+        'contentview': [
+            entities.ContentView(nailgun_conf), entities.ContentView(nailgun_conf, id=id)]
+    }
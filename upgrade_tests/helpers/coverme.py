@@ -1,5 +1,22 @@
 """Unit tests for upgrade test helpers
 """
+import fcntl
+import gzip
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from upgrade.helpers import settings
+from upgrade.helpers.constants.constants import OS_REPOS
+from upgrade.helpers.constants.constants import RH_CONTENT
+from upgrade.helpers.logger import CompressedRotatingFileHandler
+from upgrade.helpers.tools import _parse_parallel_commands_output
+from upgrade_tests.helpers import existence
+from upgrade_tests.helpers import variants
 from upgrade_tests.helpers.variants import assert_varients
 FROM_VERSION = '6.8'
 TO_VERSION = '6.9'
@@ -15,3 +32,317 @@ def test_67_to_68_no_diff():
 
 def test_67_to_68_no_component():
     assert assert_varients('non_exist_component', 'foo', 'foo')
+
+
+def test_all_entity_variants_expected():
+    versions = settings.upgrade.supported_sat_versions
+    from_index = versions.index(settings.upgrade.from_version)
+    to_index = versions.index(settings.upgrade.to_version)
+    for component, varients in variants._entity_varients.items():
+        for single_list in varients:
+            assert assert_varients(component, single_list[from_index], single_list[to_index])
+    assert not assert_varients('filter', 'foo', 'bar')
+    assert assert_varients('filter', ['foo'], ['foo'])
+
+
+def test_depreciated_attrs_filtered():
+    depreciated = sorted(variants._depreciated[settings.upgrade.to_version]['settings'])
+    attr_data = ['keep', depreciated[0], None, depreciated[1], depreciated[0]]
+    assert variants.depreciated_attrs_less_component_data('settings', attr_data) == [
+        'keep', None]
+    assert len(attr_data) == 5
+    assert variants.depreciated_attrs_less_component_data('host', attr_data) == attr_data
+
+
+def test_assert_variants_compiled_once():
+    lookups = [(component, single_list[0], 'unexpected')
+               for component, varients in variants._entity_varients.items()
+               for single_list in varients] * 100
+    variants._compiled_entity_varients.cache_clear()
+    for component, pre, post in lookups:
+        assert not assert_varients(component, pre, post)
+    # The lookup tables are built by the first lookup only, not scanned per lookup
+    cache_info = variants._compiled_entity_varients.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, len(lookups) - 1)
+
+
+def test_indexed_component_lookup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    hosts = [{'id': '1', 'name': 'host1'}, {'id': '2', 'name': 'host2'}, {'id': '1', 'name': 'dup'}]
+    (tmp_path / 'preupgrade_cli').write_text(json.dumps([{'domain': []}, {'host': hosts}]))
+    existence.clear_datastore_cache()
+    index = existence._indexed_component('preupgrade', 'cli', 'host', 'id')
+    assert existence._find_on_indexed_component(index, 'id', '1', 'name') == 'host1'
+    assert existence._find_on_indexed_component(index, 'id', '2', 'ip') == \
+        existence._find_on_list_of_dicts_using_search_criteria(hosts, {'id': '2'}, 'ip')
+    assert existence._find_on_indexed_component(index, 'id', '3', 'name') == \
+        existence._find_on_list_of_dicts_using_search_criteria(hosts, {'id': '3'}, 'name')
+    existence.clear_datastore_cache()
+
+
+def test_api_pages_reads_all_pages():
+    class Response:
+        def __init__(self, page):
+            self.page = page
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            results = [{'id': i} for i in range(5)][(self.page - 1) * 2:self.page * 2]
+            return {'subtotal': 5, 'results': results}
+
+    class Session:
+        def get(self, url, params):
+            return Response(params['page'])
+
+    pages = list(existence._api_pages(Session(), 'https://sat/api/domains', 2))
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_write_and_read_datastore_component(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    comps_data = [('domain', iter([{'id': 1}, {'id': 2}])), ('subnet', []), ('host', [{'id': 3}])]
+    existence.write_datastore('preupgrade_api', comps_data)
+    assert existence.get_datastore_component('preupgrade', 'api', 'host') == [{'id': 3}]
+    assert existence.get_datastore_component('preupgrade', 'api', 'subnet') == []
+    index = existence._datastore_index('preupgrade_api')
+    (tmp_path / 'preupgrade_api.index').unlink()
+    assert existence._datastore_index('preupgrade_api') == index
+    assert existence.get_datastore('preupgrade', 'api') == [
+        {'domain': [{'id': 1}, {'id': 2}]}, {'subnet': []}, {'host': [{'id': 3}]}]
+
+
+def test_failed_datastore_capture_keeps_previous(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existence.write_datastore('preupgrade_api', [('domain', [{'id': 1}]), ('host', [{'id': 2}])])
+
+    def failing_entities():
+        yield {'id': 3}
+        raise RuntimeError('API read failed')
+
+    with pytest.raises(RuntimeError):
+        existence.write_datastore('preupgrade_api', [('host', failing_entities())])
+    assert existence.get_datastore_component('preupgrade', 'api', 'host') == [{'id': 2}]
+    # A stale index of an other datastore file is not trusted
+    (tmp_path / 'preupgrade_api').write_bytes(b'{"__component__": "host"}\n{"id": 4}\n')
+    assert existence.get_datastore_component('preupgrade', 'api', 'host') == [{'id': 4}]
+
+
+def test_convert_json_datastore(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = [{'domain': [{'id': '1', 'name': 'a.com'}]}, {'host': [{'id': '2'}]}]
+    (tmp_path / 'preupgrade_cli').write_text(json.dumps(data))
+    existence.clear_datastore_cache()
+    assert existence.get_datastore_component('preupgrade', 'cli', 'host') == [{'id': '2'}]
+    assert existence.get_datastore_component('preupgrade', 'cli', 'domain') == data[0]['domain']
+    assert existence._json_datastore.cache_info().misses == 1
+    existence.convert_json_datastore('preupgrade', 'cli')
+    assert not existence._is_json_datastore('preupgrade_cli')
+    assert existence.get_datastore('preupgrade', 'cli') == data
+
+
+def test_compare_templates_by_content_hash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existence.write_templatestore('preupgrade', {
+        ('template', '1'): 'same', ('template', '2'): 'old', ('template', '3'): 'gone'})
+    existence.write_templatestore('postupgrade', {
+        ('template', '1'): 'same', ('template', '2'): 'new'})
+    compared = dict(zip(['1', '2', '3'], existence.compare_templates('template')))
+    assert compared['1'] == ('true', 'true')
+    assert compared['2'] == ('old', 'new')
+    assert 'missing' in compared['3'][0]
+    existence._templatestore_manifest.cache_clear()
+
+
+def test_parallel_and_serial_templatestore_alike(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    listed = {'template': [{'id': '1'}]}
+    monkeypatch.setattr(existence, 'csv_reader', lambda template_type, *args: {
+        template_type: listed.get(template_type, [])})
+    monkeypatch.setattr(existence, 'parallel_csv_reader', lambda components, *args: [
+        {template_type: listed.get(template_type, [])} for template_type, _ in components])
+    # The fabric run output is stripped and has the pty line endings
+    monkeypatch.setattr(existence, 'template_reader', lambda *args: 'a\r\nb')
+    monkeypatch.setattr(existence, 'set_hammer_config', lambda: None)
+    monkeypatch.setitem(existence.env, 'hammer_user', 'admin')
+    monkeypatch.setitem(existence.env, 'hammer_password', 'changeme')
+    monkeypatch.setattr(existence, 'execute', lambda func, commands, *args, host: {
+        host: {key: {'stdout': 'a\nb\n', 'return_code': 0} for key in commands}})
+    existence.set_templatestore('preupgrade', sat_host='sat', workers=1)
+    existence.set_templatestore('postupgrade', sat_host='sat', workers=4)
+    assert existence.compare_templates('template') == [('true', 'true')]
+    assert existence.find_templatestore('preupgrade', 'template', '1')[1] == 'a\nb'
+    existence._templatestore_manifest.cache_clear()
+
+
+def test_compare_legacy_templates_with_templatestore(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    legacy_path = tmp_path / 'preupgrade_templates' / 'template'
+    legacy_path.mkdir(parents=True)
+    (legacy_path / '1.erb').write_bytes(b'a\r\nb\r\n')
+    (legacy_path / '2.erb').write_bytes(b'old\n')
+    existence._templatestore_manifest.cache_clear()
+    existence.write_templatestore('postupgrade', {
+        ('template', '1'): existence._normalized_template('a\nb\n'), ('template', '2'): 'new'})
+    compared = dict(zip(['1', '2'], existence.compare_templates('template')))
+    assert compared['1'] == ('true', 'true')
+    assert compared['2'] == ('old', 'new')
+    existence._templatestore_manifest.cache_clear()
+
+
+def test_parse_parallel_commands_output_of_killed_command():
+    output = '\n'.join([
+        '0 0 10.0 12.5 b2s=',
+        # The rc file of the killed command is missing
+        '1    cGFydA==',
+        '2 1 10.0 11.0 ',
+    ])
+    results = _parse_parallel_commands_output(['ok', 'killed', 'failed'], output)
+    assert results == {
+        'ok': {'stdout': 'ok', 'return_code': 0, 'duration': 2.5},
+        'killed': {'stdout': 'part', 'return_code': None, 'duration': 0},
+        'failed': {'stdout': '', 'return_code': 1, 'duration': 1.0},
+    }
+
+
+def test_parallel_csv_reader_with_hammer_credentials(monkeypatch):
+    hammer_configs = []
+    monkeypatch.setattr(existence, 'set_hammer_config', lambda: hammer_configs.append(True))
+    monkeypatch.setitem(existence.env, 'hammer_user', 'admin')
+    monkeypatch.setitem(existence.env, 'hammer_password', 'change me')
+    run_commands = []
+
+    def execute(func, commands, workers, host):
+        run_commands.extend(commands.values())
+        return {host: {'host': {'stdout': 'Id,Name\n1,host1\n', 'return_code': 0,
+                                'duration': 1.0},
+                       'domain': {'stdout': 'Id', 'return_code': None, 'duration': 0}}}
+    monkeypatch.setattr(existence, 'execute', execute)
+    monkeypatch.setattr(existence, 'csv_reader', lambda component, *args: {component: []})
+    assert existence.parallel_csv_reader(
+        [('host', 'list'), ('domain', 'list')], 'sat', 2) == [
+        {'host': [{'id': '1', 'name': 'host1'}]}, {'domain': []}]
+    assert run_commands[0] == \
+        "hammer --username admin --password 'change me' --output csv host list"
+    assert hammer_configs
+
+
+def test_template_diff():
+    pre = 'a\nb\nc\nd\ne\nf\n'
+    post = 'a\nc\nd\nx\ne\nf\ny\n'
+    difference = existence.template_diff(pre, post)
+    assert [line[2:] for line in difference if not line.startswith('+')] == pre.splitlines()
+    assert [line[2:] for line in difference if not line.startswith('-')] == post.splitlines()
+    assert [line for line in difference if line[0] in '+-'] == ['- b', '+ x', '+ y']
+    assert existence.template_diff(pre, pre) == [f'  {line}' for line in pre.splitlines()]
+
+
+def test_assert_templates_variants():
+    assert existence.assert_templates('template', 'foo', "foo\n<%= snippet 'efibootmgr_netboot' %>")
+    assert not existence.assert_templates('template', 'foo', 'bar')
+
+
+def test_job_execution_time_traced(tmp_path, monkeypatch):
+    from upgrade.helpers import tasks
+    from upgrade.helpers.tracing import read_trace
+    monkeypatch.chdir(tmp_path)
+    with pytest.deprecated_call():
+        start_time = tasks.job_execution_time('backup')
+    with pytest.deprecated_call():
+        assert tasks.job_execution_time('backup', start_time) is None
+    assert [(record['name'], record['outcome']) for record in read_trace()] == [
+        ('backup', 'success')]
+    assert not tasks._job_spans
+
+
+def test_lazy_settings_import():
+    code = ('import sys; '
+            'import upgrade.helpers.constants.constants; '
+            'from upgrade.helpers import settings, nailgun_conf; '
+            'print(settings.is_built, nailgun_conf.is_built, "dynaconf" in sys.modules)')
+    output = subprocess.run(
+        [sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.split()
+    assert output[-3:] == ['False', 'False', 'False']
+    assert list(OS_REPOS) == ['baseos', 'appstream']
+    assert OS_REPOS['baseos'] is RH_CONTENT['baseos']
+
+
+def test_fabfile_imports_task_modules_lazily():
+    code = ('import sys, fabfile; '
+            'print(fabfile.host_pings.__doc__.split(".")[0].strip(), "|", '
+            '"upgrade.helpers.tools" in sys.modules, "upgrade.runner" in sys.modules)')
+    output = subprocess.run(
+        [sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    assert output.split('\n')[-2] == \
+        'This ensures the given IP/hostname is reachable on its ssh port | False False'
+
+
+def test_log_file_rotated_to_gzip(tmp_path):
+    log_path = str(tmp_path / 'full_upgrade')
+    hdlr = CompressedRotatingFileHandler(log_path, shared=True)
+    hdlr.maxBytes = 100
+    messages = [f'line {index} {"x" * 40}' for index in range(6)]
+    # Not rotated while a forked process holds the log file writers lock
+    lock_fd = os.open(f'{log_path}.lock', os.O_RDWR | os.O_CREAT)
+    fcntl.flock(lock_fd, fcntl.LOCK_SH)
+    for message in messages[:3]:
+        hdlr.handle(logging.makeLogRecord({'msg': message}))
+    assert not os.path.exists(f'{log_path}.1.gz')
+    os.close(lock_fd)
+    for message in messages[3:]:
+        hdlr.handle(logging.makeLogRecord({'msg': message}))
+    hdlr.flush_batch()
+    hdlr.close()
+    backups = sorted(tmp_path.glob('full_upgrade.*.gz'), reverse=True)
+    assert backups
+    with gzip.open(backups[0], 'rt') as backup:
+        assert backup.read().splitlines() == messages[:3]
+    logged = []
+    for backup_path in backups:
+        with gzip.open(backup_path, 'rt') as backup:
+            logged += backup.read().splitlines()
+    assert logged + (tmp_path / 'full_upgrade').read_text().splitlines() == messages
+
+
+def _run_logging_script(code, cwd):
+    subprocess.run(
+        [sys.executable, '-c', code], cwd=cwd,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return [line.split(' ', 3)[3]
+            for line in (cwd / 'full_upgrade').read_text().splitlines()]
+
+
+def test_forked_parallel_task_logs(tmp_path):
+    code = (
+        'from fabric.api import env, execute, parallel\n'
+        'from upgrade.helpers.logger import logger\n'
+        'log = logger()\n'
+        '@parallel\n'
+        'def log_task():\n'
+        '    for index in range(100):\n'
+        '        log.info(f"{env.host} line {index}")\n'
+        'execute(log_task, hosts=["h1", "h2", "h3"])\n'
+        'log.info("parent line")\n'
+    )
+    logged = _run_logging_script(code, tmp_path)
+    assert sorted(logged[:-1]) == sorted(
+        f'{host} line {index}' for host in ['h1', 'h2', 'h3'] for index in range(100))
+    assert logged[-1] == 'parent line'
+    assert (tmp_path / 'full_upgrade.lock').exists()
+
+
+def test_logs_flushed_at_exit(tmp_path):
+    code = (
+        'from upgrade.helpers.logger import logger\n'
+        'log = logger()\n'
+        'for index in range(1000):\n'
+        '    log.info(f"line {index}")\n'
+        'log.highlight("done")\n'
+    )
+    assert _run_logging_script(code, tmp_path) == [
+        f'line {index}' for index in range(1000)] + ['done']
+    assert (tmp_path / 'upgrade_highlights').read_text() == 'done\n'
@@ -2,24 +2,40 @@
 post upgrade
 """
 import csv
-import filecmp
+import hashlib
 import json
 import os
-from difflib import Differ
+import shlex
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pprint import pprint
 
+import requests
 from automation_tools.satellite6.hammer import hammer
 from automation_tools.satellite6.hammer import set_hammer_config
+from fabric.api import env
 from fabric.api import execute
 from nailgun.config import ServerConfig
 
 from upgrade.helpers import settings
+from upgrade.helpers.logger import logger
 from upgrade.helpers.tools import get_setup_data
+from upgrade.helpers.tools import run_parallel_commands
 from upgrade_tests.helpers.constants import API_COMPONENTS
 from upgrade_tests.helpers.constants import CLI_ATTRIBUTES_KEY
 from upgrade_tests.helpers.constants import CLI_COMPONENTS
 from upgrade_tests.helpers.variants import depreciated_attrs_less_component_data
-from upgrade_tests.helpers.variants import template_varients
+from upgrade_tests.helpers.variants import expected_template_change
+
+logger = logger()
+
+# The key of header record of each component section in the datastore file
+DATASTORE_HEADER = '__component__'
+
+# The foreman template types stored in templatestore
+TEMPLATE_TYPES = ('job-template', 'template', 'partition-table')
 
 
 class IncorrectEndpointException(Exception):
@@ -45,12 +61,34 @@ def csv_reader(component, subcommand, sat_host=None):
     :param string subcommand: subcommand for above component. e.g list, info
     :returns dict: The dict repr of hammer csv output of given command
     """
-    comp_dict = dict()
-    entity_list = list()
     sat_host = sat_host or get_setup_data()['sat_host']
     set_hammer_config()
     data = execute(
         hammer, f'{component} {subcommand}', 'csv', host=sat_host)[sat_host]
+    return _csv_to_component_dict(component, data)
+
+
+def _hammer_command(command, output):
+    """Returns the hammer command run with the credentials set by set_hammer_config,
+    as the hammer function runs it. set_hammer_config must be called first
+
+    :param str command: The hammer subcommand and its options
+    :param str output: The hammer output format
+    :returns str: The hammer command
+    """
+    return (f"hammer --username {shlex.quote(env['hammer_user'])} "
+            f"--password {shlex.quote(env['hammer_password'])} --output {output} {command}")
+
+
+def _csv_to_component_dict(component, data):
+    """Returns the dict representation of the hammer csv output of a component
+
+    :param string component: Satellite component name. e.g host, capsule
+    :param string data: The hammer csv output of the component
+    :returns dict: The dict repr of hammer csv output as explained in csv_reader
+    """
+    comp_dict = dict()
+    entity_list = list()
     csv_read = csv.DictReader(data.lower().split('\n'))
     for row in csv_read:
         if 'warning:' in row:
@@ -60,6 +98,48 @@ def csv_reader(component, subcommand, sat_host=None):
     return comp_dict
 
 
+def parallel_csv_reader(components, sat_host=None, workers=None):
+    """Reads all the components entities data using hammer csv output
+    concurrently and returns the dict representation of the entities of each
+    component in the order of given components.
+
+    All the hammer commands are run on satellite in one remote execution with at
+    most ```workers``` commands at a time, with the hammer credentials of
+    set_hammer_config. The time taken by each component is logged.
+
+    :param list components: The list of tuples of satellite component name and
+        its subcommand. e.g [('host', 'list'), ('product', 'list --organization-id 1')]
+    :param str sat_host: The satellite hostname
+    :param int workers: The maximum number of hammer commands running at a time
+    :returns list: The list of dict repr of hammer csv output of each component
+        as returned by csv_reader
+    """
+    sat_host = sat_host or get_setup_data(sat_host)['sat_host']
+    workers = int(workers or settings.upgrade.existence_test.capture_workers or 1)
+    set_hammer_config()
+    commands = {
+        component: _hammer_command(f'{component} {subcommand}', 'csv')
+        for component, subcommand in components
+    }
+    start_time = time.time()
+    results = execute(run_parallel_commands, commands, workers, host=sat_host)[sat_host]
+    comps_data = []
+    for component, subcommand in components:
+        if results.get(component, {}).get('return_code') is None:
+            logger.warning(f'Concurrent read of {component} data failed, reading it again')
+            comps_data.append(csv_reader(component, subcommand, sat_host))
+            continue
+        if results[component]['return_code'] != 0:
+            logger.warning(f'hammer {component} {subcommand} exited with return code '
+                           f'{results[component]["return_code"]}')
+        logger.info(f'Reading {component} data from satellite has taken '
+                    f'{results[component]["duration"]} seconds')
+        comps_data.append(_csv_to_component_dict(component, results[component]['stdout']))
+    logger.info(f'Reading {len(components)} components data from satellite with {workers} '
+                f'workers has taken {round(time.time() - start_time, 3)} seconds')
+    return comps_data
+
+
 def set_api_server_config(sat_host=None, user=None, passwd=None, verify=None):
     """Sets ServerConfig configuration required by nailgun to read entities
 
@@ -77,7 +157,80 @@ def set_api_server_config(sat_host=None, user=None, passwd=None, verify=None):
     ServerConfig(auth=auth, url=url, verify=verify).save()
 
 
-def api_reader(component):
+def _api_session(entity, workers):
+    """Returns the requests session to read the entities from satellite API
+
+    The session keeps a pool of ```workers``` connections and is authenticated
+    with the server config of the nailgun entity
+
+    :param entity: The nailgun entity object of which server config to be used
+    :param int workers: The number of connections kept in the pool
+    :returns requests.Session: The session object
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    client_kwargs = entity._server_config.get_client_kwargs()
+    session.auth = client_kwargs.get('auth')
+    session.verify = client_kwargs.get('verify', False)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+
+def _api_pages(session, url, per_page):
+    """Yields every page of the search results of an API endpoint
+
+    :param requests.Session session: The session used to request the pages
+    :param str url: The API endpoint url to search the entities
+    :param int per_page: The number of entities requested per page
+    :returns generator: The list of entities search results of each page
+    """
+    page = 1
+    fetched = 0
+    while True:
+        response = session.get(url, params={'page': page, 'per_page': per_page})
+        response.raise_for_status()
+        data = response.json()
+        results = data.get('results', [])
+        if results:
+            yield results
+        fetched += len(results)
+        if len(results) < per_page or fetched >= int(data.get('subtotal') or 0):
+            break
+        page += 1
+
+
+def api_entities(component, workers=None, per_page=None):
+    """Yields each entity data of a component reading all the pages of the
+    component search results from the satellite API
+
+    The entities data of each page is read concurrently over a pool of
+    ```workers``` connections and yielded in the search results order as soon as
+    the page is read.
+
+    :param string component: Satellite component name. e.g domain, subnet
+    :param int workers: The number of entities read at a time. Defaults to the
+        existence_test capture_workers setting
+    :param int per_page: The number of entities searched per page. Defaults to
+        the existence_test api_per_page setting
+    :returns generator: The dict repr of each entity data of the component
+    """
+    workers = int(workers or settings.upgrade.existence_test.capture_workers or 1)
+    per_page = int(per_page or settings.upgrade.existence_test.api_per_page or 1000)
+    entity = API_COMPONENTS()[component][0]
+    base_url = entity.path('base')
+    with _api_session(entity, workers) as session, ThreadPoolExecutor(workers) as executor:
+        def read_entity(entity_id):
+            response = session.get(f'{base_url}/{entity_id}')
+            response.raise_for_status()
+            return response.json()
+
+        for results in _api_pages(session, base_url, per_page):
+            yield from executor.map(read_entity, [result['id'] for result in results])
+
+
+def api_reader(component, workers=None, per_page=None):
     """Reads each entity data of all components using nailgun helpers and returns
     the dict representation of all the entities
 
@@ -98,19 +251,14 @@ def api_reader(component):
         }]
      }
 
+    All the pages of the component search results are read, see api_entities.
+
     :param string component: Satellite component name. e.g host, capsule
+    :param int workers: The number of entities read at a time
+    :param int per_page: The number of entities searched per page
     :returns dict: The dict repr of entities data of all components
     """
-    comp_data = dict()
-    comp_entity_data = list()
-    comp_entity_list = API_COMPONENTS()[component][0].search_json()
-    for unique_id in comp_entity_list['results']:
-        single_entity_info = API_COMPONENTS(
-            unique_id['id']
-        )[component][1].read_json()
-        comp_entity_data.append(single_entity_info)
-    comp_data[component] = comp_entity_data
-    return comp_data
+    return {component: list(api_entities(component, workers, per_page))}
 
 
 def template_reader(template_type, template_id, sat_host=None):
@@ -128,36 +276,91 @@ def template_reader(template_type, template_id, sat_host=None):
     return template_dump
 
 
-def _template_writer(datastorestate, template_type, template_ids, sat_host=None):
-    """Reads the template from satellite and writes the template to
-    $pwd/```datastorestate```_templates/```template_type```/```template_ids```.erb
+def _normalized_template(content):
+    """Returns the template dump with the line endings and the surrounding
+    whitespace of the serial fabric run and the parallel script outputs alike,
+    so that the same template content is hashed the same
 
-    :param str datastorestate: Either preupgrade or postupgrade
-    :param str template_type: The satellite template type
-    :param str template_ids: The template id
+    :param str content: The template dump output
+    :return str: The template content
     """
-    datastorestate_dir = f'{datastorestate}_templates'
-    if not os.path.exists(datastorestate_dir):
-        os.makedirs(datastorestate_dir)
-    templates_dir = f'{datastorestate_dir}/{template_type}'
-    if not os.path.exists(templates_dir):
-        os.makedirs(templates_dir)
-    for template_id in template_ids:
-        with open(f'{templates_dir}/{template_id}.erb', 'w') as tempFile:
-            tempFile.write(template_reader(template_type, template_id, sat_host))
+    return str(content).replace('\r\n', '\n').strip()
+
+
+def _templatestore_path(datastorestate):
+    """Returns the templatestore archive path of datastorestate"""
+    return f'{datastorestate}_templates.zip'
 
 
-def set_templatestore(datastorestate, sat_host=None):
-    """Creates the ```datastorestate```_templates directory and writes all templates inside there
-    respective directory
+def write_templatestore(datastorestate, templates):
+    """Writes the templates to the compressed templatestore archive
+    $pwd/```datastorestate```_templates.zip
+
+    Each template content is stored once as objects/<sha256 of content> and the
+    manifest.json maps the template type and id to the content hash:
+    {'template': {'1': 'e3b0c442...', '2': '...'}, 'job-template': {...}}
+
+    :param str datastorestate: Either preupgrade or postupgrade
+    :param dict templates: The dict of (template_type, template_id) tuple and the
+        template content
+    """
+    manifest = {template_type: {} for template_type in TEMPLATE_TYPES}
+    with zipfile.ZipFile(
+            _templatestore_path(datastorestate), 'w', zipfile.ZIP_DEFLATED) as store:
+        stored = set()
+        for (template_type, template_id), content in templates.items():
+            content_hash = hashlib.sha256(content.encode()).hexdigest()
+            manifest.setdefault(template_type, {})[str(template_id)] = content_hash
+            if content_hash not in stored:
+                store.writestr(f'objects/{content_hash}', content)
+                stored.add(content_hash)
+        store.writestr('manifest.json', json.dumps(manifest))
+    _templatestore_manifest.cache_clear()
+
+
+def set_templatestore(datastorestate, sat_host=None, workers=None):
+    """Reads all the templates from satellite and writes them to the
+    ```datastorestate```_templates.zip templatestore. see write_templatestore
+
+    The templates are dumped concurrently on satellite in one remote execution
+    with at most ```workers``` hammer commands at a time.
 
     :param datastorestate: Either preupgrade or postupgrade
+    :param str sat_host: The satellite hostname
+    :param int workers: The number of templates dumped concurrently, dumped
+        serially if 1. Defaults to the existence_test capture_workers setting.
     """
-    for template_type in ('job-template', 'template', 'partition-table'):
-        temp_ids = [template['id'] for template in csv_reader(
-            template_type, 'list', sat_host)[template_type]]
-        _template_writer(
-            datastorestate, template_type, temp_ids, sat_host=sat_host)
+    sat_host = sat_host or get_setup_data(sat_host)['sat_host']
+    workers = int(workers or settings.upgrade.existence_test.capture_workers or 1)
+    if workers > 1:
+        templates_list = parallel_csv_reader(
+            [(template_type, 'list') for template_type in TEMPLATE_TYPES], sat_host, workers)
+    else:
+        templates_list = [
+            csv_reader(template_type, 'list', sat_host) for template_type in TEMPLATE_TYPES]
+    template_keys = [
+        (template_type, template['id'])
+        for comp_dict in templates_list
+        for template_type, comp_templates in comp_dict.items()
+        for template in comp_templates
+    ]
+    results = {}
+    if workers > 1:
+        set_hammer_config()
+        commands = {
+            (template_type, template_id):
+                _hammer_command(f'{template_type} dump --id {template_id}', 'base')
+            for template_type, template_id in template_keys
+        }
+        results = execute(run_parallel_commands, commands, workers, host=sat_host)[sat_host]
+    templates = {}
+    for template_type, template_id in template_keys:
+        if results.get((template_type, template_id), {}).get('return_code') is not None:
+            content = results[(template_type, template_id)]['stdout']
+        else:
+            content = template_reader(template_type, template_id, sat_host)
+        templates[(template_type, template_id)] = _normalized_template(content)
+    write_templatestore(datastorestate, templates)
 
 
 def _find_on_list_of_dicts(lst, data_key, all_=False):
@@ -216,23 +419,186 @@ def _find_on_list_of_dicts_using_search_criteria(
     return f'{search_key} : {search_value} entity missing'
 
 
-def set_datastore(datastore, endpoint, sat_host=None):
-    """Creates an endpoint file with all the satellite components data in json
-    format
+def _json_line(data):
+    """Returns the data as a json encoded datastore record line"""
+    return f'{json.dumps(data)}\n'.encode()
 
-    Here data is a list representation of all satellite component properties
-    in format:
-    [
-    {'c1':[{c1_ent1:'val', 'c1_ent2':'val'}]},
-    {'c2':[{c2_ent1:'val', 'c2_ent2':'val'}]}
-    ]
-    where c1 and c2 are sat components e.g host, capsule, role
-    ent1 and ent2 are component properties e.g host ip, capsule name
+
+def write_datastore(path, comps_data):
+    """Writes the satellite components data to the datastore file as soon as
+    each component entity is read
+
+    The datastore is a newline delimited json file where each component
+    section starts with a header record followed by one record per entity:
+    {"__component__": "c1"}
+    {c1_ent1:'val', 'c1_ent2':'val'}
+    {"__component__": "c2"}
+    {c2_ent1:'val', 'c2_ent2':'val'}
+
+    The byte offset of each component header and its entities count are
+    written to ```path```.index file with the datastore file size as
+    {'size': size, 'components': {'c1': [offset, count], ...}}
+
+    Both files are written aside and replace the previous datastore only once
+    all the components are read, so a failed capture keeps the previous one.
+
+    :param str path: The datastore file path
+    :param iterable comps_data: The iterable of tuples of component name and the
+        iterable of its entities data
+    """
+    index = dict()
+    with open(f'{path}.tmp', 'wb') as ds:
+        for component, entities in comps_data:
+            offset = ds.tell()
+            ds.write(_json_line({DATASTORE_HEADER: component}))
+            count = 0
+            for entity in entities:
+                ds.write(_json_line(entity))
+                count += 1
+            index[component] = [offset, count]
+        size = ds.tell()
+    with open(f'{path}.tmp.index', 'w') as index_file:
+        json.dump({'size': size, 'components': index}, index_file)
+    os.replace(f'{path}.tmp.index', f'{path}.index')
+    os.replace(f'{path}.tmp', path)
+
+
+def _is_json_datastore(path):
+    """Returns True if the datastore file is in the json format written before the
+    newline delimited json format. see convert_json_datastore
+    """
+    with open(path, 'rb') as ds:
+        return ds.read(1) == b'['
+
+
+def _datastore_index(path):
+    """Returns the component offsets index of the datastore file
+
+    The index is read from ```path```.index file and built from the datastore
+    component headers if the index file is not available or is not of the
+    current datastore file
+
+    :param str path: The datastore file path
+    :returns dict: The dict of component name and [offset, count] of its section
+    """
+    if os.path.exists(f'{path}.index'):
+        with open(f'{path}.index') as index_file:
+            index = json.load(index_file)
+        if index.get('size') == os.path.getsize(path):
+            return index['components']
+    index = dict()
+    header_prefix = f'{{"{DATASTORE_HEADER}": '.encode()
+    with open(path, 'rb') as ds:
+        component = None
+        offset = 0
+        for line in iter(ds.readline, b''):
+            if line.startswith(header_prefix):
+                component = json.loads(line)[DATASTORE_HEADER]
+                index[component] = [offset, 0]
+            elif component is not None:
+                index[component][1] += 1
+            offset += len(line)
+    return index
+
+
+def _datastore_path(datastore, endpoint):
+    """Returns the datastore file path of an endpoint
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: It has to be either cli or api.
+    """
+    if endpoint not in settings.upgrade.existence_test.allowed_ends:
+        raise IncorrectEndpointException('Endpoints has to be one of {}'.format(
+            settings.upgrade.existence_test.allowed_ends))
+    return f'{datastore}_{endpoint}'
+
+
+@lru_cache(maxsize=4)
+def _json_datastore(path, mtime_ns, size):
+    """Returns the data of the json format datastore file, parsed once per file
+    version instead of once per component read
+
+    :param str path: The datastore file path
+    :param int mtime_ns: The datastore file modification time, to read it again
+        once it is re-written
+    :param int size: The datastore file size
+    :returns list: The data as returned by get_datastore function
+    """
+    with open(path) as ds:
+        return json.load(ds)
+
+
+def iter_datastore_component(datastore, endpoint, component):
+    """Yields each entity data of a single component from the datastore file
+    without reading the other components data
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: It has to be either cli or api.
+    :param str component: The component name of which entities to read
+    :returns generator: The dict repr of each entity data of the component
+    """
+    path = _datastore_path(datastore, endpoint)
+    if _is_json_datastore(path):
+        stat = os.stat(path)
+        yield from _find_on_list_of_dicts(
+            _json_datastore(path, stat.st_mtime_ns, stat.st_size), component)
+        return
+    index = _datastore_index(path)
+    if component not in index:
+        raise KeyError(
+            f'Unable to find data for key \'{component}\' in satellite.')
+    offset, count = index[component]
+    with open(path, 'rb') as ds:
+        ds.seek(offset)
+        ds.readline()
+        for _ in range(count):
+            yield json.loads(ds.readline())
+
+
+def get_datastore_component(datastore, endpoint, component):
+    """Returns the list of all the entities data of a single component from the
+    datastore file
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: It has to be either cli or api.
+    :param str component: The component name of which entities to read
+    :returns list: The list of dict repr of the component entities
+    """
+    return list(iter_datastore_component(datastore, endpoint, component))
+
+
+def convert_json_datastore(datastore, endpoint):
+    """Converts the json format datastore file written by older set_datastore
+    to the newline delimited json format. see write_datastore
+
+    e.g preupgrade_cli file captured before upgrade with the older codebase
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: It has to be either cli or api.
+    """
+    path = _datastore_path(datastore, endpoint)
+    if not _is_json_datastore(path):
+        return
+    with open(path) as ds:
+        all_comps_data = json.load(ds)
+    write_datastore(path, (item for comp_dict in all_comps_data for item in comp_dict.items()))
+    clear_datastore_cache()
+
+
+def set_datastore(datastore, endpoint, sat_host=None, workers=None):
+    """Creates an endpoint file with all the satellite components data in
+    newline delimited json format
+
+    Each component data is written as soon as it is read from satellite, see
+    write_datastore for the datastore file format
 
     :param str datastore: A file name without extension where all sat component
     data will be exported
     :param str endpoint: An endpoints of satellite to get the data and create
     datastore. It has to be either cli or api.
+    :param int workers: The number of cli components read concurrently from
+    satellite, read serially if 1. Defaults to the existence_test
+    capture_workers setting.
 
     Environment Variable:
 
@@ -243,27 +609,32 @@ def set_datastore(datastore, endpoint, sat_host=None):
 
     """
     if endpoint == 'cli':
-        nonorged_comps_data = [
-            csv_reader(
-                component, 'list', sat_host) for component in CLI_COMPONENTS['org_not_required']]
-        orged_comps_data = [
-            csv_reader(
-                component, 'list --organization-id 1', sat_host
-            ) for component in CLI_COMPONENTS['org_required']
+        workers = int(workers or settings.upgrade.existence_test.capture_workers or 1)
+        components = [
+            (component, 'list') for component in CLI_COMPONENTS['org_not_required']
+        ] + [
+            (component, 'list --organization-id 1')
+            for component in CLI_COMPONENTS['org_required']
         ]
-        all_comps_data = nonorged_comps_data + orged_comps_data
+        if workers > 1:
+            all_comps_data = parallel_csv_reader(components, sat_host, workers)
+        else:
+            all_comps_data = (
+                csv_reader(component, subcommand, sat_host)
+                for component, subcommand in components
+            )
+        comps_data = (item for comp_dict in all_comps_data for item in comp_dict.items())
     elif endpoint == 'api':
         set_api_server_config(sat_host)
-        api_comps = list(API_COMPONENTS().keys())
-        all_comps_data = [
-            api_reader(component) for component in api_comps
-        ]
+        comps_data = (
+            (component, api_entities(component)) for component in API_COMPONENTS().keys()
+        )
     else:
         raise IncorrectEndpointException(
             f'Endpoints has to be one of {settings.upgrade.existence_test.allowed_ends}')
 
-    with open(f'{datastore}_{endpoint}', 'w') as ds:
-        json.dump(all_comps_data, ds)
+    write_datastore(f'{datastore}_{endpoint}', comps_data)
+    clear_datastore_cache()
 
 
 def get_datastore(datastore, endpoint):
@@ -281,16 +652,21 @@ def get_datastore(datastore, endpoint):
     where c1 and c2 are sat components e.g host, capsule, role
     ent1 and ent2 are component properties e.g host ip, capsule name
 
+    Use get_datastore_component to read a single component data.
+
     :param str datastore: A file name from where all sat component data will
     be imported
     :param str endpoint: An endpoint of satellite to select the correct
         datastore file. It has to be either cli or api.
     """
-    if endpoint not in settings.upgrade.existence_test.allowed_ends:
-        raise IncorrectEndpointException('Endpoints has to be one of {}'.format(
-            settings.upgrade.existence_test.allowed_ends))
-    with open(f'{datastore}_{endpoint}') as ds:
-        return json.load(ds)
+    path = _datastore_path(datastore, endpoint)
+    if _is_json_datastore(path):
+        with open(path) as ds:
+            return json.load(ds)
+    return [
+        {component: get_datastore_component(datastore, endpoint, component)}
+        for component in _datastore_index(path)
+    ]
 
 
 def find_datastore(datastore, component, attribute, search_criteria=None):
@@ -332,6 +708,73 @@ def find_datastore(datastore, component, attribute, search_criteria=None):
                 comp_data, search_criteria, attribute)
 
 
+@lru_cache(maxsize=None)
+def _cached_component(datastore, endpoint, component):
+    """Returns the entities data of a component from the datastore, reading
+    only that component section of the datastore file once per session
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: An endpoint of satellite to select the correct
+        datastore file. It has to be either cli or api.
+    :param str component: The component name of which entities to read
+    :returns list: The data as returned by get_datastore_component function
+    """
+    return get_datastore_component(datastore, endpoint, component)
+
+
+@lru_cache(maxsize=None)
+def _indexed_component(datastore, endpoint, component, key):
+    """Returns all the entities of a component from the cached datastore
+    indexed by the value of their key attribute
+
+    e.g component='host', key='id'
+    then, {'1': {'id': '1', 'name': 'host1.ab.com'}, '2': {...}}
+
+    Only the first entity is indexed if the key value is not unique, which is
+    the entity a linear search on the component data would have found.
+
+    :param str datastore: Either preupgrade or postupgrade
+    :param str endpoint: Either cli or api
+    :param str component: The component name of which entities to index
+    :param str key: The attribute name of entities used as index key
+    :returns dict: The entities of component keyed by their key attribute value
+    """
+    index = dict()
+    for entity in _cached_component(datastore, endpoint, component):
+        if key in entity:
+            index.setdefault(str(entity[key]), entity)
+    return index
+
+
+def _find_on_indexed_component(index, search_key, search_value, attr):
+    """Returns the value of attr key of an entity from the indexed component
+    data with the help of search_key and search_value
+
+    Same as _find_on_list_of_dicts_using_search_criteria but a constant time
+    lookup on the data returned by _indexed_component
+
+    :param dict index: The indexed component data from _indexed_component
+    :param str search_key: The attribute name with which component is indexed
+    :param str search_value: The attribute value of entity to search
+    :param str attr: The attribute name of which value to be retrieved
+    :returns the value of given attr of the entity or the 'missing' message
+    """
+    entity = index.get(search_value)
+    if entity is None:
+        return f'{search_key} : {search_value} entity missing'
+    return entity.get(attr, f'{attr} attribute missing for {search_key} : {search_value}')
+
+
+def clear_datastore_cache():
+    """Clears the datastore data and indexes cached by compare_postupgrade
+
+    Required if the datastore files are re-written in the same session
+    """
+    _cached_component.cache_clear()
+    _indexed_component.cache_clear()
+    _json_datastore.cache_clear()
+
+
 def compare_postupgrade(component, attribute):
     """Returns the given component attribute value from preupgrade and
     postupgrade datastore
@@ -340,6 +783,10 @@ def compare_postupgrade(component, attribute):
     versions order. Like 1st item for 6.1, 2nd for 6.2 and so on.
     e.g ('id','uuid') here 'id' is in 6.1 and 'uuid' in 6.2.
 
+    The datastore files are read only once per session and the component
+    entities are indexed by their key attribute, so repeated calls for
+    different attributes of the same component don't re-parse the datastore.
+
     :param str component: The sat component name of which attribute value to
         fetch from datastore
     :param str/tuple attribute: String if component attribute name is same in
@@ -360,23 +807,23 @@ def compare_postupgrade(component, attribute):
     else:
         raise TypeError('Wrong attribute type provided in test. '
                         'Please provide one of string/tuple.')
-    # Getting preupgrade and postupgrade data
-    predata = get_datastore('preupgrade', endpoint)
-    postdata = get_datastore('postupgrade', endpoint)
+    pre_attr = pre_attr.lower()
+    post_attr = post_attr.lower()
     entity_values = []
     atr = 'id' if endpoint == 'api' else CLI_ATTRIBUTES_KEY[component]
-    for test_case in find_datastore(predata, component, atr):
-        preupgrade_entity = find_datastore(
-            predata,
-            component,
-            search_criteria={atr: str(test_case)},
-            attribute=pre_attr)
-        postupgrade_entity = find_datastore(
-            postdata,
-            component,
-            search_criteria={atr: str(test_case)},
-            attribute=post_attr
-        )
+    component = component.lower()
+    test_cases = find_datastore(
+        [{component: _cached_component('preupgrade', endpoint, component)}], component, atr)
+    if not test_cases:
+        return entity_values
+    # Getting preupgrade and postupgrade data indexed by the key attribute
+    preindex = _indexed_component('preupgrade', endpoint, component, atr)
+    postindex = _indexed_component('postupgrade', endpoint, component, atr)
+    for test_case in test_cases:
+        preupgrade_entity = _find_on_indexed_component(
+            preindex, atr, str(test_case), pre_attr)
+        postupgrade_entity = _find_on_indexed_component(
+            postindex, atr, str(test_case), post_attr)
         if 'missing' in str(preupgrade_entity) or 'missing' in str(postupgrade_entity):
             culprit = preupgrade_entity if 'missing' in preupgrade_entity \
                 else postupgrade_entity
@@ -388,6 +835,37 @@ def compare_postupgrade(component, attribute):
     return entity_values
 
 
+@lru_cache(maxsize=None)
+def _templatestore_manifest(templatestorestate):
+    """Returns the manifest of templatestorestate templatestore archive, the
+    dict of template type and the dict of template id and its content hash
+
+    The manifest of templatestore written as
+    $pwd/```templatestorestate```_templates/```template_type```/```template_id```.erb
+    files by older set_templatestore is built from the templates content,
+    normalized as the templates of the archive are.
+
+    :param templatestorestate: Either preupgrade or postupgrade
+    :returns dict: {template_type: {template_id: content_hash}}
+    """
+    store_path = _templatestore_path(templatestorestate)
+    if os.path.exists(store_path):
+        with zipfile.ZipFile(store_path) as store:
+            return json.loads(store.read('manifest.json'))
+    manifest = {}
+    for template_type in TEMPLATE_TYPES:
+        templates_path = f'{templatestorestate}_templates/{template_type}'
+        manifest[template_type] = {}
+        if not os.path.exists(templates_path):
+            continue
+        for temp_name in sorted(os.listdir(templates_path)):
+            with open(f'{templates_path}/{temp_name}', 'rb') as template:
+                content = _normalized_template(template.read().decode())
+            manifest[template_type][temp_name[:-len('.erb')]] = \
+                hashlib.sha256(content.encode()).hexdigest()
+    return manifest
+
+
 def find_templatestore(templatestorestate, template_type, template_id=None):
     """Returns a particular template data or all ids of template_type templates stored in
     templatestorestate
@@ -401,44 +879,47 @@ def find_templatestore(templatestorestate, template_type, template_id=None):
     :param str template_type: The template type
     :param str template_id: The template id
     """
-    templates_path = f'{templatestorestate}_templates/{template_type}'
+    templates = _templatestore_manifest(templatestorestate).get(template_type, {})
     if not template_id:
         # Returns list of template ids of template type
-        return [temp_name.strip('.erb') for temp_name in os.listdir(templates_path)]
+        return list(templates)
     template_id = template_id.strip()
-    template_path = f'{templates_path}/{template_id}.erb'
-    if not os.path.exists(template_path):
+    if template_id not in templates:
         return f'{template_type} template of ID {template_id} is missing'
-    with open(f'{template_path}') as template:
-        return template_path, template.read()
+    store_path = _templatestore_path(templatestorestate)
+    if os.path.exists(store_path):
+        with zipfile.ZipFile(store_path) as store:
+            return (f'{store_path}:{template_type}/{template_id}',
+                    store.read(f'objects/{templates[template_id]}').decode())
+    template_path = f'{templatestorestate}_templates/{template_type}/{template_id}.erb'
+    with open(template_path, 'rb') as template:
+        return template_path, _normalized_template(template.read().decode())
 
 
 def compare_templates(template_type):
     """Helper to compare provisioning, ptables and job templates
     Returns every template_type templates data from preupgrade and postupgrade datastore if
-    the compFile finds the difference else return (true, true) to directly pass the test without
-    actually comparing the contents of templates
+    their content hashes differ else return (true, true) to directly pass the test without
+    actually reading the contents of templates
 
     :param str template_type: The template type
     """
-    supported_templates = ('job-template', 'template', 'partition-table')
-    if template_type not in supported_templates:
+    if template_type not in TEMPLATE_TYPES:
         raise IncorrectTemplateTypeException(
-            'The Template Type has to be one of {}'.format(supported_templates))
+            'The Template Type has to be one of {}'.format(TEMPLATE_TYPES))
     entity_values = list()
-    for template_id in find_templatestore('preupgrade', template_type):
-        prefile, pre_template = find_templatestore('preupgrade', template_type, template_id)
-        postfile, post_template = find_templatestore('postupgrade', template_type, template_id)
-        if 'missing' in str(pre_template) or 'missing' in str(post_template):
-            culprit = prefile if 'missing' in pre_template \
-                else postfile
-            culprit_ver = f' missing in Version {settings.upgrade.from_version}' \
-                if 'missing' in pre_template \
-                else f' missing in Version {settings.upgrade.to_version}'
-            entity_values.append((culprit, culprit_ver))
-        elif filecmp.cmp(prefile, postfile):
+    pre_templates = _templatestore_manifest('preupgrade').get(template_type, {})
+    post_templates = _templatestore_manifest('postupgrade').get(template_type, {})
+    for template_id, pre_hash in pre_templates.items():
+        if template_id not in post_templates:
+            entity_values.append((
+                find_templatestore('postupgrade', template_type, template_id),
+                f' missing in Version {settings.upgrade.to_version}'))
+        elif pre_hash == post_templates[template_id]:
             entity_values.append(('true', 'true'))
         else:
+            _, pre_template = find_templatestore('preupgrade', template_type, template_id)
+            _, post_template = find_templatestore('postupgrade', template_type, template_id)
             entity_values.append((pre_template, post_template))
     return entity_values
 
@@ -459,6 +940,101 @@ def pytest_ids(data):
     return ids
 
 
+def _myers_line_diff(pre_lines, post_lines):
+    """Returns the shortest line diff of pre_lines and post_lines using the
+    Myers O((N+M)D) difference algorithm
+
+    Only the diagonals -d..d reached by each edit step d are kept to walk back
+    the edit path, so the memory is O(D^2) of the D edits, not of the lines.
+
+    :param list pre_lines: The list of preupgrade lines
+    :param list post_lines: The list of postupgrade lines
+    :return list: The diff lines prefixed with '  ' if unchanged, '- ' if removed
+        and '+ ' if added, in the Differ().compare output format without hints
+    """
+    pre_count, post_count = len(pre_lines), len(post_lines)
+    max_depth = pre_count + post_count
+    # The furthest x reached on each diagonal, the diagonal k at index offset + k
+    offset = max_depth + 1
+    furthest = [0] * (2 * max_depth + 3)
+    # The furthest x of the diagonals -d, -d + 2 .. d reached by each step d
+    trace = []
+    for depth in range(max_depth + 1):
+        for diagonal in range(-depth, depth + 1, 2):
+            index = offset + diagonal
+            if diagonal == -depth or (
+                    diagonal != depth and furthest[index - 1] < furthest[index + 1]):
+                x = furthest[index + 1]
+            else:
+                x = furthest[index - 1] + 1
+            y = x - diagonal
+            while x < pre_count and y < post_count and pre_lines[x] == post_lines[y]:
+                x += 1
+                y += 1
+            furthest[index] = x
+            if x >= pre_count and y >= post_count:
+                break
+        else:
+            trace.append(furthest[offset - depth:offset + depth + 1:2])
+            continue
+        break
+    # Walk back the edit path from the end of both the lines
+    difference = []
+    x, y = pre_count, post_count
+    for depth in range(depth, -1, -1):
+        if depth == 0:
+            prev_x = prev_y = 0
+        else:
+            previous = trace[depth - 1]
+            diagonal = x - y
+            if diagonal == -depth or (
+                    diagonal != depth
+                    and previous[(diagonal + depth - 2) // 2] < previous[(diagonal + depth) // 2]):
+                prev_diagonal = diagonal + 1
+            else:
+                prev_diagonal = diagonal - 1
+            prev_x = previous[(prev_diagonal + depth - 1) // 2]
+            prev_y = prev_x - prev_diagonal
+        while x > prev_x and y > prev_y:
+            difference.append(f'  {pre_lines[x - 1]}')
+            x -= 1
+            y -= 1
+        if depth > 0:
+            if x == prev_x:
+                difference.append(f'+ {post_lines[y - 1]}')
+            else:
+                difference.append(f'- {pre_lines[x - 1]}')
+        x, y = prev_x, prev_y
+    difference.reverse()
+    return difference
+
+
+def template_diff(pre, post):
+    """Returns the line diff of preupgrade and postupgrade templates
+
+    The common leading and trailing lines are skipped before diffing the
+    changed part of templates, see _myers_line_diff for the diff format
+
+    :param str pre: The preupgrade template content
+    :param str post: The postupgrade template content
+    :return list: The diff lines prefixed with '  ', '- ' or '+ '
+    """
+    pre_lines, post_lines = pre.splitlines(), post.splitlines()
+    shortest = min(len(pre_lines), len(post_lines))
+    head = 0
+    while head < shortest and pre_lines[head] == post_lines[head]:
+        head += 1
+    tail = 0
+    while tail < shortest - head and pre_lines[-1 - tail] == post_lines[-1 - tail]:
+        tail += 1
+    return (
+        [f'  {line}' for line in pre_lines[:head]]
+        + _myers_line_diff(
+            pre_lines[head:len(pre_lines) - tail], post_lines[head:len(post_lines) - tail])
+        + [f'  {line}' for line in pre_lines[len(pre_lines) - tail:]]
+    )
+
+
 def assert_templates(template_type, pre, post):
     """Alternates the result of assert by diff comparing the template data
 
@@ -475,14 +1051,10 @@ def assert_templates(template_type, pre, post):
     :param post: The postupgrade template of template_type same as preupgrade template
     :return: True if the templates difference is expected else False
     """
-    diff = Differ()
-    difference = list(diff.compare(pre.splitlines(), post.splitlines()))
-    del diff
-    added_elements = [added for added in difference if added.startswith('+')]
-    removed_elements = [added for added in difference if added.startswith('-')]
-    for changed_element in added_elements + removed_elements:
-        for expected_varients in template_varients[template_type]:
-            if changed_element in expected_varients:
-                return True
+    difference = template_diff(pre, post)
+    for changed_element in difference:
+        if changed_element.startswith(('+', '-')) and \
+                expected_template_change(template_type, changed_element):
+            return True
     pprint(difference)
     return False
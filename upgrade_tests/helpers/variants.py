@@ -1,4 +1,6 @@
 """All the variants those changes during upgrade and the helper functions"""
+from functools import lru_cache
+
 from upgrade.helpers import settings
 
 
@@ -796,6 +798,17 @@ _depreciated = {
 }
 
 
+@lru_cache(maxsize=None)
+def _depreciated_entities(to_version, component):
+    """Returns the set of depreciated entities of a component in to_version
+
+    :param string to_version: The postupgrade satellite version
+    :param string component: The component of which the attrs are depreciated
+    :return frozenset: The depreciated component entities from the _depreciated dict
+    """
+    return frozenset(_depreciated.get(to_version, {}).get(component, ()))
+
+
 def depreciated_attrs_less_component_data(component, attr_data):
     """Removes the depreciated attribute entities of a component from all
     entities of a component attribute
@@ -807,22 +820,76 @@ def depreciated_attrs_less_component_data(component, attr_data):
     :param list attr_data: List of component attribute entities
         e.g All the setting names / setting values etc.
     :return list: attr_data with removed depreciated component entities from
-        the _depreciated dict
+        the _depreciated dict, the given attr_data is not modified
+    """
+    depreciated = _depreciated_entities(settings.upgrade.to_version, component)
+    if not depreciated:
+        return attr_data
+    return [
+        attr_entity for attr_entity in attr_data
+        if not (isinstance(attr_entity, str) and attr_entity in depreciated)
+    ]
+
+
+@lru_cache(maxsize=None)
+def _compiled_entity_varients(supported_sat_versions, from_version, to_version):
+    """Returns the _entity_varients of from_version to to_version upgrade
+    compiled into the lookup tables of each component
+
+    e.g {'filter': {'lookupkey': frozenset({'variablelookupkey'}), ...}, ...}
+
+    :param tuple supported_sat_versions: The supported satellite versions in
+        the _entity_varients lists order
+    :param string from_version: The preupgrade satellite version
+    :param string to_version: The postupgrade satellite version
+    :return dict: The dict of component name and the dict of preupgrade value
+        and the set of its expected postupgrade values
+    """
+    from_index = supported_sat_versions.index(from_version)
+    to_index = supported_sat_versions.index(to_version)
+    compiled = {}
+    for component, varients in _entity_varients.items():
+        table = {}
+        for single_list in varients:
+            table.setdefault(single_list[from_index], set()).add(single_list[to_index])
+        compiled[component] = {pre: frozenset(posts) for pre, posts in table.items()}
+    return compiled
+
+
+@lru_cache(maxsize=None)
+def _compiled_template_varients(template_type):
+    """Returns the template_varients of template_type compiled for fast lookup
+
+    :param string template_type: The template type
+    :return tuple: The set of all the variants and all the variants joined with
+        the null character, which never appears in a template line, to search a
+        changed line in all the variants at once
+    """
+    varients = template_varients.get(template_type, [])
+    return frozenset(varients), '\0'.join(varients)
+
+
+def expected_template_change(template_type, changed_element):
+    """Returns True if the changed template line is an expected template variant
+
+    The changed line is expected if its a part of any of the template_varients
+    of template_type
+
+    :param string template_type: The template type
+    :param string changed_element: The changed line of template prefixed with
+        '+ ' or '- '
+    :return bool: True if the change is expected else False
     """
-    ver = settings.upgrade.to_version
-    if _depreciated.get(ver):
-        if _depreciated[ver].get(component):
-            for depr_attr_entity in _depreciated[ver][component]:
-                if depr_attr_entity in attr_data:
-                    attr_data.remove(depr_attr_entity)
-    return attr_data
+    varients, joined_varients = _compiled_template_varients(template_type)
+    return changed_element in varients or changed_element in joined_varients
 
 
 def assert_varients(component, pre, post):
     """Alternates the result of assert if the value of entity attribute is
     'expected' to change during upgrade
 
-    It takes help from the entity_varients directory above for known changes
+    It takes help from the entity_varients directory above for known changes,
+    compiled once per upgrade path into constant time lookup tables
 
     e.g IF filters resource type 'lookupkey' in 6.1 is expected to change to
     'variablelookupkey' when upgraded to 6.2, then
@@ -850,9 +917,12 @@ def assert_varients(component, pre, post):
             'Unsupported postupgrade version {} provided for '
             'entity variants existence tests'.format(to_version))
 
-    if component in _entity_varients:
-        for single_list in _entity_varients[component]:
-            if pre == single_list[supported_sat_versions.index(from_version)]:
-                if post == single_list[supported_sat_versions.index(to_version)]:
-                    return True
+    expected = _compiled_entity_varients(
+        tuple(supported_sat_versions), from_version, to_version).get(component, {})
+    try:
+        if post in expected.get(pre, ()):
+            return True
+    except TypeError:
+        # Unhashable values like lists are never listed as variants
+        pass
     return pre == post